@@ -16,6 +16,55 @@ class DjangoEveOnlineConnectorConfig(AppConfig):
     ESI_SECRET_KEY = os.environ.get('ESI_SECRET_KEY', "")
     ESI_CALLBACK_URL = os.environ.get('ESI_CALLBACK_URL', "")
 
+    # Number of keep-alive ESI clients kept per worker process
+    ESI_CLIENT_POOL_SIZE = int(os.environ.get('ESI_CLIENT_POOL_SIZE', 10))
+
+    # Concurrent workers and retry rounds used when fetching X-Pages of an ESI operation
+    ESI_PAGE_WORKERS = int(os.environ.get('ESI_PAGE_WORKERS', 4))
+    ESI_PAGE_RETRIES = int(os.environ.get('ESI_PAGE_RETRIES', 2))
+
+    # Concurrent workers used when fanning out other bulk ESI lookups
+    ESI_BULK_WORKERS = int(os.environ.get('ESI_BULK_WORKERS', 8))
+
+    # Where ESI ETags are stored for conditional requests: "cache", "database", a dotted path to a store class, or "" to disable
+    ESI_ETAG_STORE = os.environ.get('ESI_ETAG_STORE', "cache")
+    ESI_ETAG_TIMEOUT = int(os.environ.get('ESI_ETAG_TIMEOUT', 604800))
+
+    # Remaining ESI error budget below which calls are spaced out, and at which calls pause until the limit resets
+    ESI_ERROR_LIMIT_SLOWDOWN = int(
+        os.environ.get('ESI_ERROR_LIMIT_SLOWDOWN', 50))
+    ESI_ERROR_LIMIT_PAUSE = int(os.environ.get('ESI_ERROR_LIMIT_PAUSE', 10))
+
+    # Directory of the on-disk ESI swagger snapshots (defaults to a per-user temporary directory, must be owned by the worker user and not writable by others), and their age in seconds before a background refresh
+    ESI_SWAGGER_DIR = os.environ.get('ESI_SWAGGER_DIR', "")
+    ESI_SWAGGER_MAX_AGE = int(os.environ.get('ESI_SWAGGER_MAX_AGE', 86400))
+
+    # Maximum random delay, in seconds, added after an ESI response expires before its dataset is fetched again
+    ESI_EXPIRES_JITTER = int(os.environ.get('ESI_EXPIRES_JITTER', 60))
+
+    # Concurrent SSO token refreshes, and the maximum refresh requests per second (0 to disable)
+    SSO_REFRESH_WORKERS = int(os.environ.get('SSO_REFRESH_WORKERS', 4))
+    SSO_REFRESH_RATE = float(os.environ.get('SSO_REFRESH_RATE', 10))
+
+    # Seconds before expiry at which an access token is refreshed instead of reused
+    SSO_REFRESH_MARGIN = int(os.environ.get('SSO_REFRESH_MARGIN', 60))
+
+    # Number of characters handled by each task queued by update_characters
+    CHARACTER_UPDATE_CHUNK_SIZE = int(
+        os.environ.get('CHARACTER_UPDATE_CHUNK_SIZE', 10))
+
+    # Number of resolved universe names kept per process, and how long resolved names are trusted, in seconds
+    ESI_NAME_CACHE_SIZE = int(os.environ.get('ESI_NAME_CACHE_SIZE', 50000))
+    ESI_NAME_CACHE_TTL = int(os.environ.get('ESI_NAME_CACHE_TTL', 604800))
+
+    # Static database (SDE) version, and the number of static resolutions memoized per process
+    EVE_STATIC_VERSION = os.environ.get('EVE_STATIC_VERSION', "")
+    EVE_STATIC_CACHE_SIZE = int(
+        os.environ.get('EVE_STATIC_CACHE_SIZE', 100000))
+
+    # Load invTypes, invGroups and invCategories into memory on first use
+    EVE_STATIC_PRELOAD = os.environ.get('EVE_STATIC_PRELOAD', "") == "True"
+
     # DO NOT EDIT
     ESI_BAD_ASSET_CATEGORIES = [42, 43]
 
@@ -57,6 +57,12 @@ task_binding = TaskBinding(
             "interval": 1,
             "interval_period": "days",
         },
+        {
+            "name": "EVE: Refresh ESI Swagger",
+            "task_name": "django_eveonline_connector.tasks.refresh_esi_swagger",
+            "interval": 1,
+            "interval_period": "days",
+        },
         {
             "name": "EVE: Assign Eve Groups",
             "task_name": "django_eveonline_connector.tasks.assign_eve_groups",
@@ -24,3 +24,12 @@ class EveServiceUnavailable(Exception):
 
     def __init__(self, msg):
         self.msg = msg
+
+
+class EveTokenRefreshTimeout(Exception):
+    """
+    Thrown when a token refresh times out waiting on the refresh lock held by another worker.
+    """
+
+    def __init__(self, msg):
+        self.msg = msg
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_eveonline_connector', '0043_auto_20210212_0305'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EveEsiEtag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=40, unique=True)),
+                ('etag', models.CharField(max_length=128)),
+                ('expires', models.DateTimeField(blank=True, null=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
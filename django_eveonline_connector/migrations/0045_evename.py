@@ -0,0 +1,23 @@
+# Generated by Django 2.2.13 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_eveonline_connector', '0044_eveesietag'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EveName',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.BigIntegerField(unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('category', models.CharField(max_length=32)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
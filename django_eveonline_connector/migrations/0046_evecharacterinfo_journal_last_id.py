@@ -0,0 +1,23 @@
+# Generated by Django 2.2.20 on 2026-10-18 02:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('django_eveonline_connector', '0045_evename'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evecharacterinfo',
+            name='journal_last_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evecharacterinfo',
+            name='journal_last_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -1,22 +1,33 @@
 
 
-from esipy import EsiClient, EsiSecurity, EsiApp
+from esipy import EsiClient, EsiSecurity
 from esipy.exceptions import APIException
 from django.core.cache import cache
-from django.db import models
+from django.db import models, transaction, IntegrityError
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth.models import User, Group
 from django.utils.dateparse import parse_datetime
 from django.apps import apps
 from django_singleton_admin.models import DjangoSingleton
-from django_eveonline_connector.exceptions import EveMissingScopeException
+from django_eveonline_connector.exceptions import EveMissingScopeException, EveTokenRefreshTimeout
+from django_eveonline_connector.utilities.esi.pool import EsiClientPool
+from django_eveonline_connector.utilities.esi.limiter import EsiErrorLimiter
+from django_eveonline_connector.utilities.esi.swagger import load_esi_app, get_esi_app_stats
+from django_eveonline_connector.utilities.esi.etags import (get_conditional_store, make_conditional_key,
+                                                            get_header, get_expires)
+from django_eveonline_connector.utilities.threads import map_concurrently, call_and_close
+from functools import partial
+import asyncio
 import datetime
 import logging
 import json
 import traceback
+import time
+import uuid
 import pyswagger
-from django.db.models import Q
+from django.db.models import Q, Exists, OuterRef, Subquery, Count, Case, When, Value, Max
+from django.db.models.functions import Coalesce
 logger = logging.getLogger(__name__)
 app_config = apps.get_app_config('django_eveonline_connector')
 
@@ -31,6 +42,22 @@ ESI Models
 These models are used as wrappers around EsiPy
 """
 
+# Process-local map of ESI operation IDs to required EveScope IDs, see EveClient.get_scope_index()
+esi_scope_index = {
+    'version': None,
+    'operations': {},
+}
+
+# Seconds an EveToken refresh may hold its lock, and between checks of a lock held by another worker
+TOKEN_REFRESH_LOCK_TIMEOUT = 30
+TOKEN_REFRESH_LOCK_POLL = 0.2
+
+# Process-local copy of the EveClient settings row, see EveClient.get_instance()
+eve_client_instance = {
+    'client': None,
+    'version': None,
+}
+
 
 class EveClient(DjangoSingleton):
     esi_base_url = models.URLField(
@@ -42,6 +69,12 @@ class EveClient(DjangoSingleton):
     def save(self, *args, **kwargs):
         cache.delete('esi_sso_urls')
         super(EveClient, self).save(*args, **kwargs)
+        EveClient.clear_instance()
+
+    def delete(self, *args, **kwargs):
+        cache.delete('esi_sso_urls')
+        super(EveClient, self).delete(*args, **kwargs)
+        EveClient.clear_instance()
 
     def __str__(self):
         return str({
@@ -86,38 +119,39 @@ class EveClient(DjangoSingleton):
             return esi_sso_url
 
     @staticmethod
-    def call(op, raise_exception=False, **kwargs):
+    def call(op, raise_exception=False, conditional=False, **kwargs):
+        """
+        Calls an ESI operation, picking a token with the required scopes from the keyword arguments.
+        With conditional=True, the stored ETag of the same call is sent as If-None-Match and a 304 response is
+        returned as-is, so the caller can skip processing unchanged data. 
+        The ETag of a 200 response is only stored by EveClient.save_conditional, once its data has been processed.
+        """
         operation = EveClient.get_esi_app().op[op]
-        # Pull the required scopes from the ESI Swagger Definition
-        required_scopes = set()
-        if operation.security:
-            for definition in operation.security:
-                if 'evesso' in definition:
-                    for scope_name in definition['evesso']:
-                        scope_creation = EveScope.objects.get_or_create(
-                            name=scope_name)
-                        scope = scope_creation[0]
-                        if scope_creation[1]:
-                            logger.error(
-                                "Encountered unknown scope '%s', please notify Krypted developers." % scope)
-                        required_scopes.add(scope)
+        # Pull the required scopes from the precompiled scope index
+        required_scopes = EveClient.get_scope_index().get(
+            operation.operationId, frozenset())
 
         # Find the token with proper scopes and access
         if required_scopes:
             if 'token' in kwargs:
-                token = kwargs.get('token')
+                token = kwargs.pop('token')
+                # uses prefetched scopes when available
+                token_scopes = {scope.pk for scope in token.scopes.all()}
                 for scope in required_scopes:
-                    if scope not in token.scopes.all():
+                    if scope not in token_scopes:
+                        scope_name = EveScope.objects.get(pk=scope).name
                         raise EveMissingScopeException(
-                            f"EveClient was passed a token that is missing the required scopes: {scope}")
+                            f"EveClient was passed a token that is missing the required scopes: {scope_name}")
 
             elif 'character_id' in kwargs:
                 try:
-                    token = EveToken.objects.get(evecharacter__external_id=kwargs.get(
-                        'character_id'), scopes__in=required_scopes)
+                    token = EveToken.objects.filter(evecharacter__external_id=kwargs.get(
+                        'character_id'), scopes__in=required_scopes).distinct().get()
                 except EveToken.DoesNotExist as e:
+                    scope_names = set(EveScope.objects.filter(
+                        pk__in=required_scopes).values_list('name', flat=True))
                     raise EveMissingScopeException(
-                        f"EveClient was passed a character_id that does not have the proper token: {required_scopes}")
+                        f"EveClient was passed a character_id that does not have the proper token: {scope_names}")
             elif 'corporation_id' in kwargs:
                 eve_corporation = EveCorporation.objects.get(
                     external_id=kwargs.get('corporation_id'))
@@ -128,8 +162,8 @@ class EveClient(DjangoSingleton):
 
                 try:
                     token_pk = eve_corporation.ceo.token.pk
-                    token = EveToken.objects.get(
-                        pk=token_pk, scopes__in=required_scopes)
+                    token = EveToken.objects.filter(
+                        pk=token_pk, scopes__in=required_scopes).distinct().get()
                 except EveToken.DoesNotExist as e:
                     raise EveMissingScopeException(
                         'EveClient was passed a corporation_id that does not have the proper CEO token')
@@ -138,50 +172,159 @@ class EveClient(DjangoSingleton):
                 raise Exception(
                     "Attempted to make protected EsiCall without valid token or auto-matching keyword argument")
         else:
+            kwargs.pop('token', None)
             token = None
 
+        req_and_resp = operation(**kwargs)
+        conditional_store = get_conditional_store() if conditional else None
+        if conditional_store:
+            conditional_key = make_conditional_key(
+                operation.operationId, kwargs)
+            conditional_state = conditional_store.get(conditional_key)
+            if conditional_state:
+                req_and_resp[0]._p['header'].update(
+                    {'If-None-Match': conditional_state['etag']})
+
         if token:
             if token.refresh():
                 logger.info(
                     f"Calling token guarded ESI: {op} with arguments {kwargs}")
 
-                request = EveClient.get_esi_client(token=token).request(
-                    operation(**kwargs), raise_on_error=raise_exception)
+                request = EveClient.request(
+                    req_and_resp, token=token, raise_exception=raise_exception)
             else:
                 logger.info(
                     f"Skipping ESI call for expired token: {op} with arguments {kwargs}")
 
         else:
             logger.info(f"Calling ESI: {op} with arguments {kwargs}")
-            request = EveClient.get_esi_client().request(
-                operation(**kwargs), raise_on_error=raise_exception)
+            request = EveClient.request(
+                req_and_resp, raise_exception=raise_exception)
 
-        if request.status not in [200, 204, 503, 504]:
+        if conditional_store and request.status == 304:
+            logger.info(
+                f"ESI call '{op}' with {kwargs} not modified since last call")
+
+        if request.status not in [200, 204, 304, 503, 504]:
             logger.warning(
                 f"Failed ({request.status}) ESI call '{op}' with {kwargs}. Response: {request.data}")
 
         return request
 
+    @staticmethod
+    async def acall(op, **kwargs):
+        """
+        Awaitable variant of EveClient.call, with the same operation lookup and token handling.
+        The request itself runs on the running event loop's executor, so one worker can keep many requests in flight.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(call_and_close, EveClient.call, op, **kwargs))
+
+    @staticmethod
+    def call_many(calls, max_workers=None):
+        """
+        Runs many (op, kwargs) calls concurrently on a bounded thread pool, see map_concurrently, and returns their responses in order.
+        A call that raised is returned as its exception, so one failure doesn't lose the other responses.
+        """
+        def call(op_and_kwargs):
+            op, kwargs = op_and_kwargs
+            try:
+                return EveClient.call(op, **kwargs)
+            except Exception as e:
+                return e
+
+        return map_concurrently(call, calls, max_workers=max_workers)
+
+    @staticmethod
+    def save_conditional(op, response, **kwargs):
+        """
+        Stores the ETag and Expires header of a 200 response to a conditional call, so the same call sends If-None-Match next time.
+        Called once the response data has been written, so data that failed to process is fetched again. 
+        """
+        conditional_store = get_conditional_store()
+        etag = get_header(response, 'ETag')
+        if conditional_store and response.status == 200 and etag:
+            kwargs.pop('token', None)
+            operation = EveClient.get_esi_app().op[op]
+            conditional_store.set(make_conditional_key(
+                operation.operationId, kwargs), etag, get_expires(response))
+
+    @staticmethod
+    def discard_conditional(op, **kwargs):
+        """
+        Forgets the stored ETag of a conditional call, e.g when its data could not be processed. 
+        """
+        conditional_store = get_conditional_store()
+        if conditional_store:
+            kwargs.pop('token', None)
+            operation = EveClient.get_esi_app().op[op]
+            conditional_store.delete(
+                make_conditional_key(operation.operationId, kwargs))
+
     @staticmethod
     def get_required_scopes(op):
         operation = EveClient.get_esi_app().op[op]
-        # Pull the required scopes from the ESI Swagger Definition
-        required_scopes = set()
-        if operation.security:
-            for definition in operation.security:
+        scope_ids = EveClient.get_scope_index().get(
+            operation.operationId, frozenset())
+        return set(EveScope.objects.filter(pk__in=scope_ids))
+
+    @staticmethod
+    def get_scope_index(esi_app=None):
+        """
+        Returns the process-local map of ESI operation IDs to required EveScope IDs.
+        Built once from the loaded EsiApp, rebuilt when the swagger version changes. 
+        """
+        if not esi_app:
+            esi_app = EveClient.get_esi_app()
+        if esi_scope_index['version'] != EveClient.get_swagger_version(esi_app):
+            EveClient.build_scope_index(esi_app)
+        return esi_scope_index['operations']
+
+    @staticmethod
+    def build_scope_index(esi_app):
+        """
+        Walks every operation in the swagger definition and maps it to the EveScope IDs it requires.
+        Unknown scopes are created in a single batch. 
+        """
+        scope_names_by_operation = {}
+        for operation in esi_app.op.values():
+            scope_names = set()
+            for definition in operation.security or []:
                 if 'evesso' in definition:
-                    for scope_name in definition['evesso']:
-                        scope_creation = EveScope.objects.get_or_create(
-                            name=scope_name)
-                        scope = scope_creation[0]
-                        if scope_creation[1]:
-                            logger.error(
-                                "Encountered unknown scope '%s', please notify Krypted developers." % scope)
-                        required_scopes.add(scope)
-        return required_scopes
+                    scope_names.update(definition['evesso'])
+            if scope_names:
+                scope_names_by_operation[operation.operationId] = scope_names
+
+        all_scope_names = set().union(*scope_names_by_operation.values())
+        scope_ids = dict(EveScope.objects.filter(
+            name__in=all_scope_names).values_list('name', 'pk'))
+        missing_scope_names = all_scope_names - set(scope_ids)
+        if missing_scope_names:
+            for scope_name in missing_scope_names:
+                logger.error(
+                    "Encountered unknown scope '%s', please notify Krypted developers." % scope_name)
+            EveScope.objects.bulk_create(
+                [EveScope(name=scope_name) for scope_name in missing_scope_names], ignore_conflicts=True)
+            scope_ids.update(EveScope.objects.filter(
+                name__in=missing_scope_names).values_list('name', 'pk'))
+
+        esi_scope_index['operations'] = {
+            operation_id: frozenset(scope_ids[name] for name in scope_names)
+            for operation_id, scope_names in scope_names_by_operation.items()
+        }
+        esi_scope_index['version'] = EveClient.get_swagger_version(esi_app)
+        return esi_scope_index['operations']
+
+    @staticmethod
+    def get_swagger_version(esi_app):
+        return esi_app.root.info.version
 
     @staticmethod
     def get_instance():
+        """
+        Returns the EveClient settings, from the app config if set there, otherwise from the settings row.
+        The row is memoized per process until EveClient.save() or delete() bumps the cache version. 
+        """
         app_config = apps.get_app_config('django_eveonline_connector')
         if app_config.ESI_SECRET_KEY and app_config.ESI_CLIENT_ID and app_config.ESI_CALLBACK_URL and app_config.ESI_BASE_URL:
             return EveClient(
@@ -190,27 +333,68 @@ class EveClient(DjangoSingleton):
                 esi_callback_url=app_config.ESI_CALLBACK_URL,
                 esi_base_url=app_config.ESI_BASE_URL)
 
-        elif EveClient.objects.all():
-            return EveClient.objects.all()[0]
+        version = cache.get('eve_client_version')
+        if eve_client_instance['client'] and eve_client_instance['version'] == version:
+            return eve_client_instance['client']
+
+        client = EveClient.objects.first()
+        if not client:
+            raise Exception("EveClient is not configured.")
+        eve_client_instance['client'] = client
+        eve_client_instance['version'] = version
+        return client
 
-        raise Exception("EveClient is not configured.")
+    @staticmethod
+    def clear_instance():
+        """
+        Drops the memoized settings row of this process, and bumps the cache version so other processes drop theirs. 
+        """
+        eve_client_instance['client'] = None
+        eve_client_instance['version'] = None
+        cache.set('eve_client_version', uuid.uuid4().hex, timeout=None)
 
     @staticmethod
     def get_esi_app():
         """
         EsiApp is used to get operations for Eve Swagger Interface 
+        Parsed once per process from the on-disk swagger snapshot, see utilities.esi.swagger. 
         """
-        if 'esi_app' in cache:
-            return cache.get('esi_app')
+        esi_app = load_esi_app()
+        EveClient.get_scope_index(esi_app)
+        return esi_app
 
-        esi_app = EsiApp(cache_time=86400).get_latest_swagger
+    @staticmethod
+    def get_esi_app_stats():
+        return get_esi_app_stats()
 
-        try:
-            cache.set('esi_app', esi_app, timeout=86400)
-        except Exception:
-            logger.exception("Failed to store ESI Application in cache")
+    @staticmethod
+    def request(req_and_resp, token=None, raise_exception=False):
+        """
+        Sends a prepared ESI operation through a pooled EsiClient.
+        Token security is attached to the request itself, so pooled clients are never bound to a token. 
+        Waits on the shared ESI error limit before sending, and records the limit from the response.
+        """
+        if token:
+            req_and_resp[0]._p['header'].update(
+                {'Authorization': 'Bearer %s' % token.access_token})
+        esi_error_limiter.wait()
+        with esi_client_pool.client() as esi_client:
+            try:
+                response = esi_client.request(
+                    req_and_resp, raise_on_error=raise_exception)
+            except APIException as e:
+                esi_error_limiter.update(e.response_header)
+                raise
+        esi_error_limiter.update(response.header)
+        return response
 
-        return esi_app
+    @staticmethod
+    def get_esi_client_pool_stats():
+        return esi_client_pool.stats
+
+    @staticmethod
+    def get_esi_error_limit_stats():
+        return esi_error_limiter.stats
 
     @staticmethod
     def get_esi_client(token=None):
@@ -222,6 +406,15 @@ class EveClient(DjangoSingleton):
         else:
             return EsiClient(headers={'User-Agent': "Krypted Platform"})
 
+    @staticmethod
+    def get_pooled_esi_client():
+        """
+        EsiClient for the per-process pool. 
+        Built without esipy's response cache: requests carry the token in their headers, so cached responses
+        would never be read again, and Expires and ETags are handled by EveClient.call and its callers.
+        """
+        return EsiClient(cache=None, headers={'User-Agent': "Krypted Platform"})
+
     @staticmethod
     def get_esi_security(token=None):
         """
@@ -242,6 +435,29 @@ class EveClient(DjangoSingleton):
         verbose_name_plural = "Eve Settings"
 
 
+class EveEsiEtag(models.Model):
+    """
+    ETag and expiry of a conditional ESI call, used when ESI_ETAG_STORE is "database".
+    """
+    key = models.CharField(max_length=40, unique=True)
+    etag = models.CharField(max_length=128)
+    expires = models.DateTimeField(blank=True, null=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "<%s:%s>" % (self.key, self.etag)
+
+
+# Per-process pool of keep-alive ESI clients, see EveClient.request()
+esi_client_pool = EsiClientPool(
+    factory=EveClient.get_pooled_esi_client,
+    size=app_config.ESI_CLIENT_POOL_SIZE)
+
+# ESI error limit shared by all workers through the cache, see EveClient.request()
+esi_error_limiter = EsiErrorLimiter(
+    slowdown=app_config.ESI_ERROR_LIMIT_SLOWDOWN,
+    pause=app_config.ESI_ERROR_LIMIT_PAUSE)
+
 """
 EVE SSO Models 
 These models are used for the EVE Online token system
@@ -270,6 +486,40 @@ class EveScope(models.Model):
         return EveScope.objects.filter(required=True)
 
 
+class EveTokenQuerySet(models.QuerySet):
+    def with_validity(self):
+        """
+        Annotates each token with has_missing_scopes, so EveToken.valid needs no further queries.
+        A scope is missing when it is required or requested, but not granted to the token.
+        """
+        granted_scopes = EveToken.scopes.through.objects
+        missing_requested_scopes = EveToken.requested_scopes.through.objects.filter(
+            evetoken_id=OuterRef('pk')
+        ).annotate(granted=Exists(granted_scopes.filter(
+            evetoken_id=OuterRef('evetoken_id'), evescope_id=OuterRef('evescope_id')))
+        ).filter(granted=False)
+
+        required_scope_ids = list(EveScope.objects.filter(
+            required=True).values_list('pk', flat=True))
+        granted_required_scopes = granted_scopes.filter(
+            evetoken_id=OuterRef('pk'), evescope_id__in=required_scope_ids
+        ).order_by().values('evetoken_id').annotate(count=Count('evescope_id')).values('count')
+
+        return self.annotate(
+            missing_requested_scopes=Exists(missing_requested_scopes),
+            granted_required_scopes=Coalesce(
+                Subquery(granted_required_scopes, output_field=models.IntegerField()), 0),
+        ).annotate(has_missing_scopes=Case(
+            When(Q(missing_requested_scopes=True) | Q(granted_required_scopes__lt=len(required_scope_ids)),
+                 then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField(),
+        ))
+
+    def valid(self):
+        return self.with_validity().filter(has_missing_scopes=False, invalidated__isnull=True)
+
+
 class EveToken(models.Model):
     access_token = models.TextField()
     refresh_token = models.TextField()
@@ -282,6 +532,8 @@ class EveToken(models.Model):
     user = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="eve_tokens", null=True)
 
+    objects = EveTokenQuerySet.as_manager()
+
     def __str__(self):
         try:
             return "<%s:%s>" % (self.evecharacter.name, self.user)
@@ -290,19 +542,64 @@ class EveToken(models.Model):
 
     @property
     def valid(self):
-        for scope in self.requested_scopes.all():
-            if scope not in self.scopes.all():
-                return False
-
-        for scope in EveScope.objects.filter(required=True):
-            if scope not in self.scopes.all():
-                return False
-
         if self.invalidated:
             return False
-        return True
+        if hasattr(self, 'has_missing_scopes'):
+            return not self.has_missing_scopes
 
-    def refresh(self):
+        # uses prefetched scopes when available
+        scope_ids = {scope.pk for scope in self.scopes.all()}
+        needed_scope_ids = {scope.pk for scope in self.requested_scopes.all()}
+        needed_scope_ids.update(EveScope.objects.filter(
+            required=True).values_list('pk', flat=True))
+        return needed_scope_ids <= scope_ids
+
+    @property
+    def needs_refresh(self):
+        """
+        True when the access token expires within SSO_REFRESH_MARGIN seconds.
+        """
+        margin = datetime.timedelta(seconds=app_config.SSO_REFRESH_MARGIN)
+        return self.expiry <= timezone.now() + margin
+
+    def refresh(self, raise_on_timeout=False):
+        """
+        Refreshes the access token through SSO, unless it is still comfortably valid.
+        Concurrent refreshes of the same token are coalesced behind a cache lock: waiters reload the token
+        refreshed by the lock holder instead of calling SSO again, and only the lock holder releases the lock. 
+        A waiter that times out reloads the token and returns whether it is still unexpired,
+        or raises EveTokenRefreshTimeout if called with raise_on_timeout=True.
+        """
+        if not self.needs_refresh:
+            logger.info("Token refresh not needed")
+            return True
+
+        lock_key = f"eve_token_refresh:{self.pk}"
+        deadline = time.monotonic() + TOKEN_REFRESH_LOCK_TIMEOUT
+        while not cache.add(lock_key, True, timeout=TOKEN_REFRESH_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                # the lock is still held, so use whatever the holder stored instead of refreshing alongside it
+                logger.warning(
+                    f"Timed out waiting on the refresh lock of token {self.pk}")
+                if raise_on_timeout:
+                    raise EveTokenRefreshTimeout(
+                        f"Timed out waiting on the refresh lock of token {self.pk}")
+                self.refresh_from_db(
+                    fields=['access_token', 'refresh_token', 'expires_in', 'expiry', 'invalidated'])
+                return self.expiry > timezone.now()
+            time.sleep(TOKEN_REFRESH_LOCK_POLL)
+        try:
+            # another worker may have refreshed the token while we waited
+            self.refresh_from_db(
+                fields=['access_token', 'refresh_token', 'expires_in', 'expiry', 'invalidated'])
+            if not self.needs_refresh:
+                logger.info("Token refresh not needed")
+                return True
+            return self._refresh()
+        finally:
+            cache.delete(lock_key)
+
+    def _refresh(self):
         esi_security = EveClient.get_esi_security()
         esi_security.update_token(self.populate())
 
@@ -315,19 +612,16 @@ class EveToken(models.Model):
                     self.save()
                 return False
             logger.exception(f"Failed up refresh token. Error: {e}")
+            raise
 
-        if timezone.now() > self.expiry:
-            if self.invalidated:
-                self.invalidated = None
-            self.access_token = new_token['access_token']
-            self.refresh_token = new_token['refresh_token']
-            self.expiry = timezone.now() + datetime.timedelta(0,
-                                                              new_token['expires_in'])
-            self.save()
-            return True
-        else:
-            logger.info("Token refresh not needed")
-            return True
+        if self.invalidated:
+            self.invalidated = None
+        self.access_token = new_token['access_token']
+        self.refresh_token = new_token['refresh_token']
+        self.expiry = timezone.now() + datetime.timedelta(0,
+                                                          new_token['expires_in'])
+        self.save()
+        return True
 
     def populate(self):
         data = {}
@@ -466,6 +760,36 @@ class EveCorporation(EveEntity):
 
         return eve_corporation
 
+    @staticmethod
+    def bulk_create_from_external_ids(external_ids):
+        """
+        Fetches the public data of many corporations concurrently and creates them in a single transaction. 
+        Corporations that fail to resolve are logged and skipped.
+        """
+        def get_corporation(external_id):
+            try:
+                response = EveClient.call(
+                    'get_corporations_corporation_id', corporation_id=external_id)
+                if response.status != 200:
+                    logger.error(
+                        f"[{response.status}] Failed to resolve corporation {external_id}: {response.data}")
+                    return None
+                return EveCorporation(
+                    name=response.data['name'],
+                    ticker=response.data['ticker'],
+                    external_id=external_id)
+            except Exception:
+                logger.exception(f"Failed to resolve corporation {external_id}")
+                return None
+
+        eve_corporations = [eve_corporation for eve_corporation in map_concurrently(
+            get_corporation, external_ids) if eve_corporation]
+        # multi-table inheritance rules out bulk_create
+        with transaction.atomic():
+            for eve_corporation in eve_corporations:
+                eve_corporation.save()
+        return eve_corporations
+
     def update_corporation_ceo(self):
         corporation_id = self.external_id
         response = EveClient.call(
@@ -597,6 +921,20 @@ These models represent entity data.
 class EveEntityData(models.Model):
     entity = models.ForeignKey(EveEntity, on_delete=models.CASCADE)
 
+    # Rows per INSERT used by create_from_esi_rows()
+    bulk_create_batch_size = 500
+    # ESI field that identifies a row within its entity, used by sync_from_esi_rows()
+    natural_key_field = None
+    # Skip rows that already exist instead of failing the INSERT, used by create_from_esi_rows()
+    bulk_create_ignore_conflicts = False
+    # Always increasing ESI row ID, compared against get_high_water_mark() to only fetch rows that are new,
+    # the model field it is stored in, and the prefix of the EveCharacterInfo fields that record the mark
+    high_water_mark_field = None
+    high_water_mark_model_field = None
+    high_water_mark_info_prefix = None
+    # ESI operation pages with `from_id` instead of X-Pages
+    from_id_paging = False
+
     @classmethod
     def create_from_esi_row(cls, data_row, entity_external_id, *args, **kwargs):
         """
@@ -620,23 +958,229 @@ class EveEntityData(models.Model):
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
         raise NotImplementedError
 
+    @classmethod
+    def create_from_esi_rows(cls, data_rows, entity_external_id, *args, **kwargs):
+        """
+        Batch variant of create_from_esi_row. 
+        Resolves the entity once, builds every Django Model in memory and writes new objects with chunked bulk_create.
+        Objects returned from _create_from_esi_row that already exist are saved individually.
+
+        Returns the list of ESI data rows that failed.
+        If called with sync=True, hands off to cls.sync_from_esi_rows() instead.
+        """
+        if kwargs.pop('sync', False):
+            return cls.sync_from_esi_rows(data_rows, entity_external_id, *args, **kwargs)
+
+        entity = EveEntity.objects.get(external_id=entity_external_id)
+        new_objects = []
+        failed_rows = []
+        for data_row in data_rows:
+            try:
+                db_object = cls._create_from_esi_row(
+                    data_row, entity_external_id, *args, **kwargs)
+                db_object.entity = entity
+                if db_object.pk:
+                    db_object.save()
+                else:
+                    new_objects.append((data_row, db_object))
+            except Exception:
+                message = (
+                    f"Failed to create {cls.__name__} from ESI data row: {data_row}.\n"
+                    f"Failed for entity {entity_external_id}\n"
+                )
+                logger.exception(message)
+                failed_rows.append(data_row)
+
+        for chunk in batch(new_objects, cls.bulk_create_batch_size):
+            try:
+                with transaction.atomic():
+                    cls.objects.bulk_create(
+                        [db_object for data_row, db_object in chunk],
+                        ignore_conflicts=cls.bulk_create_ignore_conflicts)
+            except IntegrityError:
+                # fall back to saving row by row, so a single conflict doesn't drop the chunk
+                for data_row, db_object in chunk:
+                    try:
+                        with transaction.atomic():
+                            db_object.save()
+                    except Exception:
+                        message = (
+                            f"Failed to create {cls.__name__} from ESI data row: {data_row}.\n"
+                            f"Failed for entity {entity_external_id}\n"
+                        )
+                        logger.exception(message)
+                        failed_rows.append(data_row)
+
+        if failed_rows:
+            logger.warning(
+                f"Failed to create {len(failed_rows)} of {len(data_rows)} {cls.__name__} rows for entity {entity_external_id}")
+
+        return failed_rows
+
+    @classmethod
+    def sync_from_esi_rows(cls, data_rows, entity_external_id, *args, **kwargs):
+        """
+        Incremental variant of create_from_esi_rows, for models that define a `natural_key_field`.
+        Loads the existing rows of the entity keyed by their natural key, and applies the difference
+        with bulk_create, bulk_update and a single delete. Rows that fail to build are left untouched.
+
+        Returns a dict with the created, updated, deleted, unchanged and failed counts.
+        """
+        key_field = cls.natural_key_field
+        entity = EveEntity.objects.get(external_id=entity_external_id)
+        existing_objects = {
+            getattr(db_object, key_field): db_object for db_object in cls.objects.filter(entity=entity)}
+        compared_fields = [field.attname for field in cls._meta.concrete_fields
+                           if not field.primary_key and field.name != 'entity']
+
+        seen_keys = set()
+        created, updated = [], []
+        counts = {'created': 0, 'updated': 0,
+                  'deleted': 0, 'unchanged': 0, 'failed': 0}
+        for data_row in data_rows:
+            key = data_row.get(key_field)
+            seen_keys.add(key)
+            try:
+                db_object = cls._create_from_esi_row(
+                    data_row, entity_external_id, *args, **kwargs)
+                db_object.entity = entity
+            except Exception:
+                message = (
+                    f"Failed to create {cls.__name__} from ESI data row: {data_row}.\n"
+                    f"Failed for entity {entity_external_id}\n"
+                )
+                logger.exception(message)
+                counts['failed'] += 1
+                continue
+
+            existing_object = existing_objects.get(key)
+            if not existing_object:
+                created.append(db_object)
+            elif any(getattr(db_object, field) != getattr(existing_object, field) for field in compared_fields):
+                db_object.pk = existing_object.pk
+                updated.append(db_object)
+            else:
+                counts['unchanged'] += 1
+
+        deleted = [db_object.pk for key, db_object in existing_objects.items()
+                   if key not in seen_keys]
+
+        with transaction.atomic():
+            cls.objects.bulk_create(
+                created, batch_size=cls.bulk_create_batch_size)
+            if updated:
+                cls.objects.bulk_update(
+                    updated, compared_fields, batch_size=cls.bulk_create_batch_size)
+            if deleted:
+                cls.objects.filter(pk__in=deleted).delete()
+
+        counts['created'] = len(created)
+        counts['updated'] = len(updated)
+        counts['deleted'] = len(deleted)
+        return counts
+
     @classmethod
     def create_from_esi_response(cls, data, entity_external_id, *args, **kwargs):
         """
         Pre-processes the response from an ESI Call and generated Django database objects using cls.create_from_esi_row()
         Wrapper around self._create_esi_response, which is defined by the extending class. 
+        Returns False if processing raised, so callers can tell a failed write from an empty one. 
         """
         try:
-            processed_data = cls._create_from_esi_response(
+            return cls._create_from_esi_response(
                 data, entity_external_id, *args, **kwargs)
         except Exception:
             logger.exception(
                 "Failed to process ESI response for %s. Data: %s" % (cls.__name__, data))
+            return False
+
+    @classmethod
+    def sync_from_esi_response(cls, data, entity_external_id, *args, **kwargs):
+        """
+        Incremental variant of create_from_esi_response, see cls.sync_from_esi_rows()
+        """
+        return cls.create_from_esi_response(data, entity_external_id, *args, sync=True, **kwargs)
 
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
         raise NotImplementedError
 
+    @classmethod
+    def get_high_water_mark(cls, entity_external_id):
+        """
+        Returns the highest `high_water_mark_field` value already stored for the character, or None.
+        Read from EveCharacterInfo, falling back to the highest row stored for the character.
+        ESI rows at or below it are not fetched or processed again.
+        """
+        if not cls.high_water_mark_field:
+            return None
+        last_id = EveCharacterInfo.objects.filter(character__external_id=entity_external_id).values_list(
+            f"{cls.high_water_mark_info_prefix}_last_id", flat=True).first()
+        if last_id:
+            return last_id
+        return cls.objects.filter(entity__external_id=entity_external_id).aggregate(
+            last_id=Max(cls.high_water_mark_model_field))['last_id']
+
+    @classmethod
+    def get_new_esi_rows(cls, data, entity_external_id):
+        """
+        Returns the ESI rows above the high-water mark of the character.
+        """
+        high_water_mark = cls.get_high_water_mark(entity_external_id)
+        if not high_water_mark:
+            return list(data)
+        return [row for row in data if row[cls.high_water_mark_field] > high_water_mark]
+
+    @classmethod
+    def set_high_water_mark(cls, entity_external_id, data, failed_rows):
+        """
+        Records the newest row stored for the character in EveCharacterInfo.
+        The mark stays below the oldest failed row, so failed rows are fetched again on the next sync.
+        """
+        key = cls.high_water_mark_field
+        if failed_rows:
+            oldest_failed_id = min(row[key] for row in failed_rows)
+            data = [row for row in data if row[key] < oldest_failed_id]
+        if not data:
+            return
+
+        character = EveCharacter.objects.filter(
+            external_id=entity_external_id).first()
+        if not character:
+            return
+        last_row = max(data, key=lambda row: row[key])
+        info = EveCharacterInfo.objects.get_or_create(character=character)[0]
+        prefix = cls.high_water_mark_info_prefix
+        setattr(info, f"{prefix}_last_id", last_row[key])
+        setattr(info, f"{prefix}_last_date",
+                parse_datetime(last_row['date'].to_json()))
+        setattr(info, f"{prefix}_last_updated", timezone.now())
+        info.save()
+
+    @staticmethod
+    def get_esi_type_ids(data):
+        """
+        Returns the type IDs referenced by an ESI response, so callers can resolve them ahead of time
+        and pass them in as `resolved_types`.
+        """
+        return set()
+
+    @staticmethod
+    def get_esi_entity_ids(data):
+        """
+        Returns the character, corporation and alliance IDs referenced by an ESI response, so callers can 
+        resolve them ahead of time and pass them in as `resolved_ids`.
+        """
+        return set()
+
+    @staticmethod
+    def get_esi_locations(data):
+        """
+        Returns the (location_id, location_type) pairs referenced by an ESI response, so callers can 
+        resolve them ahead of time with resolve_locations() and pass them in as `resolved_locations`.
+        """
+        return set()
+
     class Meta:
         abstract = True
 
@@ -652,6 +1196,8 @@ class EveAsset(EveEntityData):
     quantity = models.IntegerField()
     type_id = models.IntegerField()
 
+    natural_key_field = 'item_id'
+
     # Mapped Static Data
     group_id = models.IntegerField()
     category_id = models.IntegerField()
@@ -672,10 +1218,23 @@ class EveAsset(EveEntityData):
         """
         return app_config.ESI_BAD_ASSET_CATEGORIES
 
+    @staticmethod
+    def get_esi_type_ids(data):
+        return {row['type_id'] for row in data}
+
+    @staticmethod
+    def get_esi_locations(data):
+        return {(row['location_id'], row['location_type']) for row in data if row['location_flag'] == "Hangar"}
+
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
-        for row in data:
-            EveAsset.create_from_esi_row(row, entity_external_id)
+        if 'resolved_types' not in kwargs:
+            kwargs['resolved_types'] = resolve_type_ids(
+                EveAsset.get_esi_type_ids(data))
+        if 'resolved_locations' not in kwargs:
+            kwargs['resolved_locations'] = resolve_locations(
+                EveAsset.get_esi_locations(data), entity_external_id)
+        return EveAsset.create_from_esi_rows(data, entity_external_id, **kwargs)
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -695,13 +1254,21 @@ class EveAsset(EveEntityData):
         else:
             asset.is_blueprint_copy = False
 
-        # Map useful static data
-        asset.group_id = resolve_type_id_to_group_id(asset.type_id)
-        asset.category_id = resolve_type_id_to_category_id(asset.type_id)
+        resolved_types = kwargs.get('resolved_types', {})
+        if asset.type_id in resolved_types:
+            resolved_type = resolved_types[asset.type_id]
+            asset.group_id = resolved_type['group_id']
+            asset.category_id = resolved_type['category_id']
+            asset.item_name = resolved_type['name']
+            asset.item_type = resolved_type['category_name']
+        else:
+            # Map useful static data
+            asset.group_id = resolve_type_id_to_group_id(asset.type_id)
+            asset.category_id = resolve_type_id_to_category_id(asset.type_id)
 
-        # Use the static database to resolve EVE Model IDs
-        asset.item_name = resolve_type_id_to_type_name(asset.type_id)
-        asset.item_type = resolve_type_id_to_category_name(asset.type_id)
+            # Use the static database to resolve EVE Model IDs
+            asset.item_name = resolve_type_id_to_type_name(asset.type_id)
+            asset.item_type = resolve_type_id_to_category_name(asset.type_id)
 
         if asset.category_id in EveAsset.get_bad_asset_category_ids():
             asset.location_name = "Unresolved Location"
@@ -709,10 +1276,14 @@ class EveAsset(EveEntityData):
 
         # Location IDs suck to resolve, we must do different things for each type
         if asset.location_flag == "Hangar":
-            asset.location_name = resolve_location_from_location_id_location_type(
-                asset.location_id,
-                asset.location_type,
-                entity_external_id)
+            if 'resolved_locations' in kwargs:
+                asset.location_name = kwargs['resolved_locations'].get(
+                    asset.location_id, f"Unknown Location ({asset.location_id})")
+            else:
+                asset.location_name = resolve_location_from_location_id_location_type(
+                    asset.location_id,
+                    asset.location_type,
+                    entity_external_id)
 
         return asset
 
@@ -727,10 +1298,26 @@ class EveJumpClone(EveEntityData):
     location = models.CharField(max_length=128)
     implants = models.TextField()
 
+    natural_key_field = 'jump_clone_id'
+
+    @staticmethod
+    def get_esi_type_ids(data):
+        return {implant for row in data['jump_clones'] for implant in row['implants']}
+
+    @staticmethod
+    def get_esi_locations(data):
+        return {(row['location_id'], row['location_type']) for row in data['jump_clones']}
+
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
-        for row in data['jump_clones']:
-            EveJumpClone.create_from_esi_row(row, entity_external_id)
+        if 'resolved_types' not in kwargs:
+            kwargs['resolved_types'] = resolve_type_ids(
+                EveJumpClone.get_esi_type_ids(data))
+        if 'resolved_locations' not in kwargs:
+            kwargs['resolved_locations'] = resolve_locations(
+                EveJumpClone.get_esi_locations(data), entity_external_id)
+        return EveJumpClone.create_from_esi_rows(
+            data['jump_clones'], entity_external_id, **kwargs)
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -744,14 +1331,22 @@ class EveJumpClone(EveEntityData):
             jump_clone_id=data_row['jump_clone_id'],)
 
         logger.debug(data_row)
-        clone.location = resolve_location_from_location_id_location_type(
-            clone.location_id,
-            clone.location_type,
-            entity_external_id)
+        if 'resolved_locations' in kwargs:
+            clone.location = kwargs['resolved_locations'].get(
+                clone.location_id, f"Unknown Location ({clone.location_id})")
+        else:
+            clone.location = resolve_location_from_location_id_location_type(
+                clone.location_id,
+                clone.location_type,
+                entity_external_id)
 
+        resolved_types = kwargs.get('resolved_types', {})
         implants = []
         for implant in data_row['implants']:
-            implants.append(resolve_type_id_to_type_name(implant))
+            if implant in resolved_types:
+                implants.append(resolved_types[implant]['name'])
+            else:
+                implants.append(resolve_type_id_to_type_name(implant))
 
         clone.implants = ",".join(implants)
         return clone
@@ -769,6 +1364,8 @@ class EveContact(EveEntityData):
     contact_name = models.CharField(max_length=64)
     contact_type = models.CharField(max_length=32, choices=id_types)
 
+    natural_key_field = 'contact_id'
+
     @property
     def evewho(self):
         return "https://%s/%s/%s" % (app_config.EVEWHO_CONFIG['domain'],
@@ -781,18 +1378,24 @@ class EveContact(EveEntityData):
                                       self.contact_type,
                                       app_config.EVEIMG_CONFIG['portrait_mapping'][self.contact_type])
 
+    @staticmethod
+    def get_esi_entity_ids(data):
+        return {contact['contact_id'] for contact in data}
+
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
         if len(data) == 0:
             return  # no contacts
         # process user ids
-        contact_ids_to_resolve = set()
-        for contact in data:
-            contact_ids_to_resolve.add(contact['contact_id'])
-        contact_names = resolve_ids(list(contact_ids_to_resolve))
-        for row in data:
-            EveContact.create_from_esi_row(
-                row, entity_external_id, contact_name=contact_names[row['contact_id']])
+        if 'resolved_ids' in kwargs:
+            resolved_ids = kwargs.pop('resolved_ids')
+            contact_names = {
+                contact_id: resolved_ids[contact_id]['name'] for contact_id in EveContact.get_esi_entity_ids(data)}
+        else:
+            contact_names = resolve_ids(
+                list(EveContact.get_esi_entity_ids(data)))
+        return EveContact.create_from_esi_rows(
+            data, entity_external_id, contact_names=contact_names, **kwargs)
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -814,7 +1417,10 @@ class EveContact(EveEntityData):
                 contact.label_ids = ",".join(label_ids)
 
         # Our Conversions
-        if 'contact_name' not in kwargs:
+        if 'contact_names' in kwargs:
+            contact.contact_name = kwargs.get(
+                'contact_names')[contact.contact_id]
+        elif 'contact_name' not in kwargs:
             logger.warning(
                 "Called without contact_name keyword argument. Performance decrease.")
             contact.contact_name = resolve_ids([data_row['contact_id']])[
@@ -864,18 +1470,102 @@ class EveContract(EveEntityData):
     items = models.TextField(null=True)
 
     @staticmethod
-    def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
+    def get_esi_entity_ids(data):
         ids_to_resolve = set()
         for contract in data:
             ids_to_resolve.add(contract['acceptor_id'])
             ids_to_resolve.add(contract['assignee_id'])
             ids_to_resolve.add(contract['issuer_id'])
             ids_to_resolve.add(contract['issuer_corporation_id'])
-        resolved_ids = resolve_ids_with_types(ids_to_resolve)
+        return ids_to_resolve
 
-        for row in data:
-            EveContract.create_from_esi_row(
-                row, entity_external_id, resolved_ids=resolved_ids, corporation=False)
+    @staticmethod
+    def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
+        """
+        Loads the existing contracts in one query and updates them with bulk_update. 
+        The items of new contracts are fetched concurrently and their types resolved in one batch, 
+        then the new contracts are written with create_from_esi_rows.
+        """
+        if 'resolved_ids' not in kwargs:
+            kwargs['resolved_ids'] = resolve_ids_with_types(
+                EveContract.get_esi_entity_ids(data))
+
+        existing_contracts = {}
+        for contract_ids in batch([row['contract_id'] for row in data], EveContract.bulk_create_batch_size):
+            for contract in EveContract.objects.filter(contract_id__in=contract_ids):
+                existing_contracts[contract.contract_id] = contract
+
+        entity = EveEntity.objects.get(external_id=entity_external_id)
+        updated_contracts = []
+        updated_fields = {'entity'}
+        field_names = {field.name for field in EveContract._meta.concrete_fields}
+        new_rows = []
+        for data_row in data:
+            contract = existing_contracts.get(data_row['contract_id'])
+            if not contract:
+                new_rows.append(data_row)
+                continue
+            EveContract.set_esi_fields(contract, data_row)
+            contract.entity = entity
+            updated_contracts.append(contract)
+            updated_fields.update(key for key in data_row if key in field_names)
+
+        if updated_contracts:
+            EveContract.objects.bulk_update(
+                updated_contracts, sorted(updated_fields), batch_size=EveContract.bulk_create_batch_size)
+
+        if not new_rows:
+            return []
+
+        contract_items = EveContract.get_contract_items(
+            [row['contract_id'] for row in new_rows], entity_external_id, token=kwargs.get('token'))
+        item_type_ids = {item['type_id'] for items in contract_items.values() for item in items}
+        resolved_types = dict(kwargs.get('resolved_types', {}))
+        missing_type_ids = item_type_ids - set(resolved_types)
+        if missing_type_ids:
+            resolved_types.update(resolve_type_ids(missing_type_ids))
+        kwargs['resolved_types'] = resolved_types
+        kwargs['contract_items'] = contract_items
+        kwargs['existing_contracts'] = existing_contracts
+
+        return EveContract.create_from_esi_rows(
+            new_rows, entity_external_id, corporation=False, **kwargs)
+
+    @staticmethod
+    def get_contract_items(contract_ids, character_id, token=None):
+        """
+        Fetches the items of many character contracts concurrently.
+        Returns a dict of contract_id to its list of items; contracts whose items could not be fetched are omitted.
+        """
+        op = 'get_characters_character_id_contracts_contract_id_items'
+        calls = []
+        for contract_id in contract_ids:
+            call_kwargs = {'character_id': character_id, 'contract_id': contract_id}
+            if token:
+                call_kwargs['token'] = token
+            calls.append((op, call_kwargs))
+
+        contract_items = {}
+        responses = EveClient.call_many(
+            calls, max_workers=app_config.ESI_BULK_WORKERS)
+        for contract_id, response in zip(contract_ids, responses):
+            if isinstance(response, Exception):
+                logger.error(
+                    f"Failed to fetch items of contract {contract_id}: {response}")
+            elif response.status == 200:
+                contract_items[contract_id] = response.data
+        return contract_items
+
+    @staticmethod
+    def set_esi_fields(contract, data_row):
+        for key in data_row.keys():
+            try:
+                if type(data_row[key]) == pyswagger.primitives._time.Datetime:
+                    data_row[key] = data_row[key].to_json()
+                setattr(contract, str(key), data_row[key])
+            except AttributeError:
+                logger.error(
+                    f"Encountered unknown attribute {key} for EveContract")
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -891,6 +1581,12 @@ class EveContract(EveEntityData):
         **Kwargs**
             **resolved_ids** (``list``)
                 Pre-resolved IDs for assignees, acceptors, etc. 
+            **resolved_types** (``dict``)
+                Pre-resolved types of the contract items, see resolve_type_ids()
+            **contract_items** (``dict``)
+                Prefetched contract items keyed by contract_id, see EveContract.get_contract_items()
+            **existing_contracts** (``dict``)
+                Prefetched EveContracts keyed by contract_id
             **corporation** (``boolean``)
                 If set, assumes we are resolving corporation contract items.
 
@@ -898,47 +1594,40 @@ class EveContract(EveEntityData):
             EveContract() instance
         """
         contract_id = data_row['contract_id']
-        if EveContract.objects.filter(contract_id=contract_id).exists():
-            contract = EveContract.objects.get(contract_id=contract_id)
-            update = True
+        if 'existing_contracts' in kwargs:
+            contract = kwargs['existing_contracts'].get(contract_id)
         else:
-            contract = EveContract()
-            update = False
+            contract = EveContract.objects.filter(
+                contract_id=contract_id).first()
 
-        for key in data_row.keys():
-            try:
-                if type(data_row[key]) == pyswagger.primitives._time.Datetime:
-                    data_row[key] = data_row[key].to_json()
-                setattr(contract, str(key), data_row[key])
-            except AttributeError:
-                logger.error(
-                    f"Encountered unknown attribute {key} for EveContract")
-
-        if update:
+        if contract:
+            EveContract.set_esi_fields(contract, data_row)
             return contract  # the other fields will already be sorted out if we're doing an update
 
+        contract = EveContract()
+        EveContract.set_esi_fields(contract, data_row)
+
         if not 'resolved_ids' in kwargs:
             logger.warning(
                 "Resolved IDs were not passed. Performance decrease.")
             ids_to_resolve = [contract.acceptor_id, contract.assignee_id,
                               contract.issuer_id, contract.issuer_corporation_id]
             resolved_ids = resolve_ids_with_types(ids_to_resolve)
-            # todo resolve IDs
         else:
             resolved_ids = kwargs.get('resolved_ids')
 
-        contracts_response = EveClient.call(
-            'get_characters_character_id_contracts_contract_id_items',
-            character_id=entity_external_id, contract_id=contract.contract_id)
-
-        if not contracts_response:
-            items = None
+        if 'contract_items' in kwargs:
+            items = kwargs['contract_items'].get(contract_id)
         else:
-            items = []
-            for item in contracts_response.data:
-                items.append("%s %s" % (
-                    item['quantity'], resolve_type_id_to_type_name(item['type_id'])))
-            contract.items = "\n".join(items)
+            items = EveContract.get_contract_items(
+                [contract_id], entity_external_id).get(contract_id)
+
+        if items is not None:
+            resolved_types = kwargs.get('resolved_types', {})
+            contract.items = "\n".join(
+                "%s %s" % (item['quantity'], resolved_types[item['type_id']]['name'] if item['type_id'] in resolved_types
+                           else resolve_type_id_to_type_name(item['type_id']))
+                for item in items)
 
         contract.acceptor_name = resolved_ids[contract.acceptor_id]['name']
         contract.assignee_name = resolved_ids[contract.assignee_id]['name']
@@ -946,7 +1635,7 @@ class EveContract(EveEntityData):
         contract.acceptor_type = resolved_ids[contract.acceptor_id]['type']
         contract.assignee_type = resolved_ids[contract.assignee_id]['type']
         contract.issuer_type = resolved_ids[contract.issuer_id]['type']
-        contract.issuer_corporation_name = resolved_ids[contract.issuer_corporation_id]
+        contract.issuer_corporation_name = resolved_ids[contract.issuer_corporation_id]['name']
 
         return contract
 
@@ -962,13 +1651,21 @@ class EveSkill(EveEntityData):
     skill_name = models.CharField(max_length=64)
     skill_group = models.CharField(max_length=64)
 
+    natural_key_field = 'skill_id'
+
     class Meta:
         unique_together = ['entity', 'skill_name']
 
+    @staticmethod
+    def get_esi_type_ids(data):
+        return {row['skill_id'] for row in data.skills}
+
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
-        for row in data.skills:
-            EveSkill.create_from_esi_row(row, entity_external_id)
+        if 'resolved_types' not in kwargs:
+            kwargs['resolved_types'] = resolve_type_ids(
+                EveSkill.get_esi_type_ids(data))
+        return EveSkill.create_from_esi_rows(data.skills, entity_external_id, **kwargs)
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -979,8 +1676,15 @@ class EveSkill(EveEntityData):
             skillpoints_in_skill=data_row['skillpoints_in_skill'],
         )
 
-        skill.skill_name = resolve_type_id_to_type_name(data_row['skill_id'])
-        skill.skill_group = resolve_type_id_to_group_name(data_row['skill_id'])
+        resolved_types = kwargs.get('resolved_types', {})
+        if skill.skill_id in resolved_types:
+            skill.skill_name = resolved_types[skill.skill_id]['name']
+            skill.skill_group = resolved_types[skill.skill_id]['group_name']
+        else:
+            skill.skill_name = resolve_type_id_to_type_name(
+                data_row['skill_id'])
+            skill.skill_group = resolve_type_id_to_group_name(
+                data_row['skill_id'])
 
         return skill
 
@@ -1007,19 +1711,38 @@ class EveJournalEntry(EveEntityData):
     second_party_name = models.CharField(max_length=64)
     second_party_type = models.CharField(max_length=32, choices=id_types)
 
+    bulk_create_ignore_conflicts = True
+    high_water_mark_field = 'id'
+    high_water_mark_model_field = 'external_id'
+    high_water_mark_info_prefix = 'journal'
+
     @staticmethod
-    def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
+    def get_esi_entity_ids(data):
         ids_to_resolve = set()
         for row in data:
             ids_to_resolve.add(row['first_party_id'])
             ids_to_resolve.add(row['second_party_id'])
-        resolved_ids = resolve_ids_with_types(ids_to_resolve)
+        return ids_to_resolve
 
-        for row in data:
-            if EveJournalEntry.objects.filter(external_id=row['id']).exists():
-                continue
-            EveJournalEntry.create_from_esi_row(
-                row, entity_external_id, resolved_ids=resolved_ids)
+    @staticmethod
+    def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
+        """
+        Stores the journal rows newer than the character's high-water mark with a bulk insert,
+        then moves the mark forward. Names are only resolved for those new rows.
+        """
+        data = EveJournalEntry.get_new_esi_rows(data, entity_external_id)
+        if not data:
+            return []
+
+        if 'resolved_ids' not in kwargs:
+            kwargs['resolved_ids'] = resolve_ids_with_types(
+                EveJournalEntry.get_esi_entity_ids(data))
+
+        failed_rows = EveJournalEntry.create_from_esi_rows(
+            data, entity_external_id, **kwargs)
+        EveJournalEntry.set_high_water_mark(
+            entity_external_id, data, failed_rows)
+        return failed_rows
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -1043,7 +1766,7 @@ class EveJournalEntry(EveEntityData):
             logger.warning(
                 "Called without Resolved IDs. Performance decrease.")
             ids_to_resolve = [entry.first_party_id, entry.second_party_id]
-            resolved_ids = resolved_ids_with_types(ids_to_resolve)
+            resolved_ids = resolve_ids_with_types(ids_to_resolve)
         else:
             resolved_ids = kwargs.get('resolved_ids')
 
@@ -1068,6 +1791,12 @@ class EveTransaction(EveEntityData):
     type_id = models.IntegerField()
     unit_price = models.FloatField()
 
+    bulk_create_ignore_conflicts = True
+    high_water_mark_field = 'transaction_id'
+    high_water_mark_model_field = 'transaction_id'
+    high_water_mark_info_prefix = 'transactions'
+    from_id_paging = True
+
     # Our Conversions
     client_name = models.CharField(max_length=64)
     client_type = models.CharField(max_length=64, choices=id_types)
@@ -1080,18 +1809,43 @@ class EveTransaction(EveEntityData):
             return EveJournalEntry.objects.get(external_id=self.journal_ref_id)
         return None
 
+    @staticmethod
+    def get_esi_type_ids(data):
+        return {row['type_id'] for row in data}
+
+    @staticmethod
+    def get_esi_entity_ids(data):
+        return {row['client_id'] for row in data}
+
+    @staticmethod
+    def get_esi_locations(data):
+        return {(row['location_id'], None) for row in data}
+
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
-        ids_to_resolve = set()
-        for row in data:
-            ids_to_resolve.add(row['client_id'])
-        resolved_ids = resolve_ids_with_types(ids_to_resolve)
+        """
+        Stores the transactions newer than the character's high-water mark with a bulk insert,
+        then moves the mark forward. Names, types and locations are resolved in bulk for those new rows only.
+        """
+        data = EveTransaction.get_new_esi_rows(data, entity_external_id)
+        if not data:
+            return []
 
-        for row in data:
-            if EveTransaction.objects.filter(transaction_id=row['transaction_id']):
-                continue
-            EveTransaction.create_from_esi_row(
-                row, entity_external_id, resolved_ids=resolved_ids)
+        if 'resolved_ids' not in kwargs:
+            kwargs['resolved_ids'] = resolve_ids_with_types(
+                EveTransaction.get_esi_entity_ids(data))
+        if 'resolved_types' not in kwargs:
+            kwargs['resolved_types'] = resolve_type_ids(
+                EveTransaction.get_esi_type_ids(data))
+        if 'resolved_locations' not in kwargs:
+            kwargs['resolved_locations'] = resolve_locations(
+                EveTransaction.get_esi_locations(data), entity_external_id)
+
+        failed_rows = EveTransaction.create_from_esi_rows(
+            data, entity_external_id, **kwargs)
+        EveTransaction.set_high_water_mark(
+            entity_external_id, data, failed_rows)
+        return failed_rows
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -1112,21 +1866,25 @@ class EveTransaction(EveEntityData):
             logger.warning(
                 "Called without Resolved IDs. Performance decrease.")
             ids_to_resolve = [transaction.client_id]
-            resolved_ids = resolved_ids_with_types(ids_to_resolve)
+            resolved_ids = resolve_ids_with_types(ids_to_resolve)
         else:
             resolved_ids = kwargs.get('resolved_ids')
 
         transaction.client_name = resolved_ids[transaction.client_id]['name']
         transaction.client_type = resolved_ids[transaction.client_id]['type']
-        transaction.item_name = resolve_type_id_to_type_name(
-            transaction.type_id)
+        resolved_types = kwargs.get('resolved_types', {})
+        if transaction.type_id in resolved_types:
+            transaction.item_name = resolved_types[transaction.type_id]['name']
+        else:
+            transaction.item_name = resolve_type_id_to_type_name(
+                transaction.type_id)
 
-        try:
-            transaction.location_name = resolve_location_from_location_id_location_type(
-                transaction.location_id, 'station', entity_external_id)
-        except Exception as e:
-            transaction.location_name = resolve_location_from_location_id_location_type(
-                transaction.location_id, 'other', entity_external_id)
+        if 'resolved_locations' in kwargs:
+            transaction.location_name = kwargs['resolved_locations'].get(
+                transaction.location_id)
+        else:
+            transaction.location_name = resolve_locations(
+                [(transaction.location_id, None)], entity_external_id).get(transaction.location_id)
 
         if not transaction.location_name:
             transaction.location_name = "Unknown Location"
@@ -1139,6 +1897,19 @@ Other EVE Models
 """
 
 
+class EveName(models.Model):
+    """
+    Universe names resolved through ESI, see utilities.esi.names
+    """
+    external_id = models.BigIntegerField(unique=True)
+    name = models.CharField(max_length=255)
+    category = models.CharField(max_length=32)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "<%s:%s>" % (self.external_id, self.name)
+
+
 class EveStructure(EveEntityData):
     # Base ESI Data
     corporation_id = models.BigIntegerField()
@@ -1182,8 +1953,7 @@ class EveStructure(EveEntityData):
 
     @staticmethod
     def _create_from_esi_response(data, entity_external_id, *args, **kwargs):
-        for row in data:
-            EveStructure.create_from_esi_row(row, entity_external_id)
+        EveStructure.create_from_esi_rows(data, entity_external_id)
 
     @staticmethod
     def _create_from_esi_row(data_row, entity_external_id, *args, **kwargs):
@@ -1286,6 +2056,12 @@ class EveCharacterInfo(models.Model):
     journal_last_updated = models.DateTimeField(blank=True, null=True)
     transactions_last_updated = models.DateTimeField(blank=True, null=True)
 
+    # newest journal entry and transaction stored, see EveEntityData.get_high_water_mark()
+    journal_last_id = models.BigIntegerField(blank=True, null=True)
+    journal_last_date = models.DateTimeField(blank=True, null=True)
+    transactions_last_id = models.BigIntegerField(blank=True, null=True)
+    transactions_last_date = models.DateTimeField(blank=True, null=True)
+
     def __str__(self):
         return self.character.name
 
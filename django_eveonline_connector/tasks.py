@@ -1,9 +1,20 @@
 from celery import shared_task
 from .models import *
+from django.apps import apps
 from django.utils import timezone
 from django.db.models import Q
-from django_eveonline_connector.exceptions import EveMissingScopeException
-from django_eveonline_connector.utilities.esi.universe import batch
+from django_eveonline_connector.exceptions import EveMissingScopeException, EveServiceUnavailable
+from django_eveonline_connector.utilities.esi.universe import batch, get_affiliations, resolve_ids_with_types
+from django_eveonline_connector.utilities.static.universe import resolve_type_ids, resolve_locations
+from django_eveonline_connector.utilities.threads import map_concurrently
+from django_eveonline_connector.utilities.esi.pages import (get_page_count, get_conditional_paged_data, get_paged_data_until,
+                                                            get_from_id_data, save_conditional_pages, discard_conditional_pages)
+from django_eveonline_connector.utilities.esi.tokens import refresh_tokens
+from django_eveonline_connector.utilities.esi.etags import get_expires
+from django_eveonline_connector.utilities.esi.swagger import refresh_snapshot
+from django_eveonline_connector.utilities.esi.schedule import is_due, get_next_run, schedule_next_run, get_due_entity_ids
+from datetime import timedelta
+from collections import Counter
 
 import logging
 import pytz
@@ -19,38 +30,67 @@ These are what users register to maintain up-to-date EveEntity information.
 def update_affiliations():
     """
     Update the affiliations for characters.
-    Cached for 3600 seconds, so don't run it more frequently than that. 
+    Runs before the Expires of the last successful ESI response are skipped. 
     """
-    character_ids = EveCharacter.objects.all().values_list('external_id', flat=True)
-    affiliations = []
-    for character_ids_segment in batch(list(character_ids), 999):
-        response = EveClient.call(
-            'post_characters_affiliation', characters=character_ids)
-        if response.status == 200:
-            affiliations = affiliations + response.data
+    if not is_due('post_characters_affiliation', 'all'):
+        logger.info(
+            f"Skipping affiliation update: Cached until {get_next_run('post_characters_affiliation', 'all')}")
+        return 0
 
+    current_affiliations = dict(EveCharacter.objects.all().values_list(
+        'external_id', 'corporation__external_id'))
+
+    affiliations, expires = get_affiliations(current_affiliations.keys())
+    # only skip the next runs when ESI answered, so an outage doesn't hold back updates
+    schedule_next_run('post_characters_affiliation', 'all', expires)
+
+    changed_affiliations = {}
     for affiliation in affiliations:
         character_id = affiliation['character_id']
         corporation_id = affiliation['corporation_id']
-        if EveCharacter.objects.filter(external_id=character_id, corporation__external_id=corporation_id).exists():
-            continue  # no need to update
-        else:
-            try:
-                character = EveCharacter.objects.get(external_id=character_id)
-                character.update_character_corporation(
-                    corporation_id=corporation_id)
-            except Exception:
-                logger.exception(
-                    f"Failed to update affiliation for {character_id}")
+        if character_id in current_affiliations and current_affiliations[character_id] != corporation_id:
+            changed_affiliations[character_id] = corporation_id
+
+    if not changed_affiliations:
+        return 0
+
+    corporation_ids = set(changed_affiliations.values())
+    corporations = dict(EveCorporation.objects.filter(
+        external_id__in=corporation_ids).values_list('external_id', 'pk'))
+    missing_corporation_ids = corporation_ids - set(corporations)
+    if missing_corporation_ids:
+        created_corporations = EveCorporation.bulk_create_from_external_ids(
+            missing_corporation_ids)
+        for corporation in created_corporations:
+            corporations[corporation.external_id] = corporation.pk
+
+    characters = []
+    for character in EveCharacter.objects.filter(external_id__in=changed_affiliations.keys()):
+        corporation_id = changed_affiliations[character.external_id]
+        if corporation_id not in corporations:
+            logger.error(
+                f"Failed to update affiliation for {character.external_id}: corporation {corporation_id} could not be created")
+            continue
+        character.corporation_id = corporations[corporation_id]
+        characters.append(character)
+
+    EveCharacter.objects.bulk_update(characters, ['corporation'])
+    logger.info(f"Updated affiliations for {len(characters)} characters")
+    return len(characters)
+
+
+@shared_task
+def refresh_esi_swagger():
+    return refresh_snapshot()
 
 
 @shared_task
 def update_tokens():
     EveToken.objects.filter(evecharacter=None).delete()
-    for token in EveToken.objects.all():
-        token.refresh()
+    outcomes = Counter(refresh_tokens(EveToken.objects.all()).values())
+    logger.info(f"Refreshed tokens: {dict(outcomes)}")
 
-    for token in EveToken.objects.all():
+    for token in EveToken.objects.with_validity():
         if token.valid and token.invalidated:
             token.invalidated = None
             token.save()
@@ -62,45 +102,43 @@ def update_tokens():
             if time_passed.days > 7:
                 token.delete()
 
+    return dict(outcomes)
+
 
 @shared_task
 def update_characters():
-    for eve_character in EveCharacter.objects.all():
-        if eve_character.token and eve_character.token.valid and eve_character.corporation and eve_character.corporation.track_characters:
-            logger.info(
-                f"Queueing batch update tasks for {eve_character.name}")
-            update_character.apply_async(args=[eve_character.external_id])
+    """
+    Queues update_character for every tracked character with a valid token, in chunks.
+    """
+    character_ids = EveCharacter.objects.filter(
+        token__in=EveToken.objects.valid().values('pk'),
+        corporation__track_characters=True
+    ).values_list('external_id', flat=True)
+    # skip characters whose datasets are all still cached by ESI
+    character_ids = get_due_entity_ids(
+        [op for op, data_model in CHARACTER_DATASETS], character_ids)
+
+    logger.info(
+        f"Queueing batch update tasks for {len(character_ids)} characters")
+    if character_ids:
+        chunk_size = apps.get_app_config(
+            'django_eveonline_connector').CHARACTER_UPDATE_CHUNK_SIZE
+        update_character.chunks(
+            [(character_id,) for character_id in character_ids], chunk_size).group().apply_async()
+    return len(character_ids)
 
 
 @shared_task
 def update_character(character_id):
     eve_character = EveCharacter.objects.get(external_id=character_id)
-    # Queue Tasks
-    update_character_assets.apply_async(
-        args=[eve_character.external_id])
-
-    update_character_contacts.apply_async(
-        args=[eve_character.external_id])
-
-    update_character_contracts.apply_async(
-        args=[eve_character.external_id])
-
-    update_character_journal.apply_async(
-        args=[eve_character.external_id])
-
-    update_character_jumpclones.apply_async(
-        args=[eve_character.external_id])
-
-    update_character_skills.apply_async(
-        args=[eve_character.external_id])
-
-    update_character_transactions.apply_async(
-        args=[eve_character.external_id])
+    results = sync_character_data(eve_character)
 
     # Additional Updates
     eve_character.update_character_corporation()
     eve_character.update_character_corporation_roles()
 
+    return results
+
 
 @shared_task
 def assign_eve_groups():
@@ -171,68 +209,265 @@ Data Model Tasks
 """
 
 
-def update_character_eveentitydata(op, data_model, character_id, delete=False):
-    """
-    Helper method for update_character_??? tasks.
-    They basically all follow the same behavior. 
+# ESI operation and data model of every dataset synced by update_character
+CHARACTER_DATASETS = [
+    ('get_characters_character_id_assets', EveAsset),
+    ('get_characters_character_id_clones', EveJumpClone),
+    ('get_characters_character_id_contacts', EveContact),
+    ('get_characters_character_id_contracts', EveContract),
+    ('get_characters_character_id_skills', EveSkill),
+    ('get_characters_character_id_wallet_journal', EveJournalEntry),
+    ('get_characters_character_id_wallet_transactions', EveTransaction),
+]
+
+
+def sync_character_data(eve_character):
     """
-    character = EveCharacter.objects.get(external_id=character_id)
+    Syncs every character dataset in one pass. 
+    The token is refreshed and its scopes are checked once, the ESI reads run concurrently, 
+    and the IDs, types and locations referenced by all datasets are resolved together before writing.
 
-    response = EveClient.call(op, character_id=character.external_id)
+    Returns a dict of data model name to the result of its update.
+    """
+    character_id = eve_character.external_id
+    token = EveToken.objects.prefetch_related(
+        'scopes').filter(evecharacter=eve_character).first()
+    if not token:
+        logger.warning(f"Skipping character update for {character_id}: No token")
+        return
+    if not token.refresh():
+        logger.warning(
+            f"Skipping character update for {character_id}: Token refresh failed")
+        return
 
-    if response.status != 200:
+    token_scopes = {scope.pk for scope in token.scopes.all()}
+    scope_index = EveClient.get_scope_index()
+    esi_app = EveClient.get_esi_app()
+    datasets = []
+    for op, data_model in CHARACTER_DATASETS:
+        required_scopes = scope_index.get(
+            esi_app.op[op].operationId, frozenset())
+        if required_scopes <= token_scopes:
+            datasets.append((op, data_model))
+        else:
+            logger.info(
+                f"Skipping batch update {data_model.__name__} for {character_id}: Missing scopes")
+
+    fetched = map_concurrently(
+        lambda dataset: get_character_eveentitydata(*dataset, character_id, token=token), datasets)
+    responses = [items for items, conditional_responses in fetched]
+
+    type_ids, entity_ids, locations = set(), set(), set()
+    for (op, data_model), items in zip(datasets, responses):
+        if items:
+            type_ids.update(data_model.get_esi_type_ids(items))
+            entity_ids.update(data_model.get_esi_entity_ids(items))
+            locations.update(data_model.get_esi_locations(items))
+    entity_ids.discard(None)
+    resolved = {}
+    try:
+        resolved['resolved_types'] = resolve_type_ids(type_ids)
+        if entity_ids:
+            resolved['resolved_ids'] = resolve_ids_with_types(entity_ids)
+        resolved['resolved_locations'] = resolve_locations(
+            locations, character_id)
+    except Exception:
+        # each dataset falls back to resolving its own IDs
+        logger.exception(f"Failed to resolve IDs for {character_id}")
+
+    results = {}
+    for (op, data_model), (items, conditional_responses) in zip(datasets, fetched):
+        # None means there is nothing to write; passing it on would fetch the dataset again
+        if items is None:
+            results[data_model.__name__] = None
+            continue
+        try:
+            if data_model.natural_key_field:
+                results[data_model.__name__] = sync_character_eveentitydata(
+                    op, data_model, character_id, items=items, conditional_responses=conditional_responses,
+                    token=token, **resolved)
+            else:
+                update_character_eveentitydata(
+                    op, data_model, character_id, items=items, conditional_responses=conditional_responses,
+                    token=token, **resolved)
+                results[data_model.__name__] = len(items) if items else 0
+        except Exception:
+            logger.exception(
+                f"Failed to batch update {data_model.__name__} for {character_id}")
+            discard_conditional_pages(
+                op, conditional_responses, character_id=character_id)
+
+        if data_model is EveSkill and items:
+            update_character_skill_points(character_id, items)
+
+    return results
+
+
+def get_character_eveentitydata(op, data_model, character_id, token=None):
+    """
+    Fetches every page of a character ESI operation for the update_character_??? tasks.
+    Returns the data, or None if it could not be fetched or has not changed since the last call,
+    and the page responses whose ETags are saved once the data has been written, see finish_conditional_pages().
+    """
+    if not is_due(op, character_id):
+        logger.info(
+            f"Skipping batch update {data_model.__name__} for {character_id}: Cached until {get_next_run(op, character_id)}")
+        return None, {}
+
+    kwargs = {'character_id': character_id}
+    if token:
+        kwargs['token'] = token
+
+    response = EveClient.call(op, conditional=True, **kwargs)
+    if response.status in [200, 304]:
+        schedule_next_run(op, character_id, get_expires(response))
+
+    # new rows of high-water mark datasets land on the first page, so other pages only need checking for the rest
+    if response.status == 304 and (data_model.high_water_mark_field or get_page_count(response) <= 1):
+        logger.info(
+            f"Skipping batch update {data_model.__name__} for {character_id}: Not modified")
+        return None, {}
+
+    if response.status not in [200, 304]:
         if response.status in [502, 503, 504]:
             logger.warning(
                 f"Skipping batch update {data_model.__name__} for {character_id} due to ESI error")
-            return
+            return None, {}
         else:
             logger.error(
                 f"[{response.status}] Failed to batch update {data_model.__name__} for {character_id}: {response.header} {response.data}")
-            return
+            return None, {}
+
+    try:
+        high_water_mark = None
+        if data_model.high_water_mark_field:
+            high_water_mark = data_model.get_high_water_mark(character_id)
+        if not high_water_mark:
+            items, conditional_responses = get_conditional_paged_data(
+                op, response, **kwargs)
+            if items is None:
+                logger.info(
+                    f"Skipping batch update {data_model.__name__} for {character_id}: Not modified")
+            return items, conditional_responses
+
+        key = data_model.high_water_mark_field
+        if data_model.from_id_paging:
+            items = get_from_id_data(
+                op, response, key, lambda row: row[key] <= high_water_mark, **kwargs)
+        else:
+            items = get_paged_data_until(
+                op, response, lambda row: row[key] <= high_water_mark, **kwargs)
+        return [row for row in items if row[key] > high_water_mark], {1: response}
+    except EveServiceUnavailable as e:
+        logger.warning(
+            f"Skipping batch update {data_model.__name__} for {character_id}: {e.msg}")
+        EveClient.discard_conditional(op, character_id=character_id)
+        return None, {}
 
-    items = response.data
 
-    if 'X-Pages' in response.header and response.header['X-Pages'][0] > 1:
-        for num in range(2, response.header['X-Pages'][0]+1):
-            response = EveClient.call(
-                op, character_id=character.external_id, page=num)
-            if response.status != 200:
-                continue
-            items += response.data
+def ingestion_failed(result):
+    """
+    Whether create_from_esi_response() raised (False), or returned failed rows or a failed count.
+    """
+    if result is False:
+        return True
+    if isinstance(result, dict):
+        return bool(result.get('failed'))
+    if isinstance(result, list):
+        return bool(result)
+    return False
+
+
+def finish_conditional_pages(op, conditional_responses, result, **kwargs):
+    """
+    Saves the ETags of the pages of a dataset once its data has been written, or forgets them if the write failed,
+    so the next run fetches the data again instead of getting a 304.
+    """
+    if ingestion_failed(result):
+        discard_conditional_pages(op, conditional_responses, **kwargs)
+    else:
+        save_conditional_pages(op, conditional_responses, **kwargs)
+
+
+def update_character_eveentitydata(op, data_model, character_id, delete=False, items=None, conditional_responses=None, **kwargs):
+    """
+    Helper method for update_character_??? tasks.
+    They basically all follow the same behavior. 
+    """
+    character = EveCharacter.objects.get(external_id=character_id)
+
+    if items is None:
+        items, conditional_responses = get_character_eveentitydata(
+            op, data_model, character_id)
+
+    if items is None:
+        return
 
     if len(items) == 0:
+        save_conditional_pages(
+            op, conditional_responses, character_id=character_id)
         return []
 
     if delete:
         data_model.objects.filter(entity=character).delete()
 
-    data_model.create_from_esi_response(items, character.external_id)
+    result = data_model.create_from_esi_response(
+        items, character.external_id, **kwargs)
+    finish_conditional_pages(
+        op, conditional_responses, result, character_id=character_id)
 
     return items
 
 
+def sync_character_eveentitydata(op, data_model, character_id, items=None, conditional_responses=None, **kwargs):
+    """
+    Incremental variant of update_character_eveentitydata, for data models with a natural key.
+    Only the rows that changed are inserted, updated or deleted.
+    Returns the diff counts that were applied.
+    """
+    if items is None:
+        items, conditional_responses = get_character_eveentitydata(
+            op, data_model, character_id)
+
+    if items is None:
+        return
+
+    if not items:
+        save_conditional_pages(
+            op, conditional_responses, character_id=character_id)
+        return
+
+    counts = data_model.sync_from_esi_response(items, character_id, **kwargs)
+    finish_conditional_pages(
+        op, conditional_responses, counts, character_id=character_id)
+    logger.info(
+        f"Synced {data_model.__name__} for {character_id}: {counts}")
+
+    return counts
+
+
 @shared_task
 def update_character_assets(character_id, *args, **kwargs):
     op = 'get_characters_character_id_assets'
     data_model = EveAsset
-    update_character_eveentitydata(
-        op, *args, **kwargs, character_id=character_id, delete=True, data_model=data_model)
+    return sync_character_eveentitydata(
+        op, *args, **kwargs, character_id=character_id, data_model=data_model)
 
 
 @shared_task
 def update_character_jumpclones(character_id, *args, **kwargs):
     op = 'get_characters_character_id_clones'
     data_model = EveJumpClone
-    update_character_eveentitydata(
-        op, *args, **kwargs, character_id=character_id, data_model=data_model, delete=True)
+    return sync_character_eveentitydata(
+        op, *args, **kwargs, character_id=character_id, data_model=data_model)
 
 
 @shared_task
 def update_character_contacts(character_id, *args, **kwargs):
     op = 'get_characters_character_id_contacts'
     data_model = EveContact
-    update_character_eveentitydata(
-        op, *args, **kwargs, character_id=character_id, data_model=data_model, delete=True)
+    return sync_character_eveentitydata(
+        op, *args, **kwargs, character_id=character_id, data_model=data_model)
 
 
 @shared_task
@@ -247,12 +482,25 @@ def update_character_contracts(character_id, *args, **kwargs):
 def update_character_skills(character_id, *args, **kwargs):
     op = 'get_characters_character_id_skills'
     data_model = EveSkill
-    response = update_character_eveentitydata(
-        op, *args, **kwargs, character_id=character_id, data_model=data_model, delete=True)
+    response, conditional_responses = get_character_eveentitydata(
+        op, character_id=character_id, data_model=data_model)
+    if response is None:
+        return
+
+    counts = sync_character_eveentitydata(
+        op, *args, **kwargs, character_id=character_id, data_model=data_model, items=response,
+        conditional_responses=conditional_responses)
+
+    if response:
+        update_character_skill_points(character_id, response)
 
+    return counts
+
+
+def update_character_skill_points(character_id, skills):
     character = EveCharacter.objects.get(external_id=character_id)
     info = EveCharacterInfo.objects.get_or_create(character=character)[0]
-    info.skill_points = response['total_sp']
+    info.skill_points = skills['total_sp']
     info.save()
 
 
@@ -283,31 +531,53 @@ def update_corporation_eveentitydata(op, data_model, corporation_id, delete=Fals
     They basically all follow the same behavior. 
     """
 
+    if not is_due(op, corporation_id):
+        logger.info(
+            f"Skipping batch update {data_model.__name__} for {corporation_id}: Cached until {get_next_run(op, corporation_id)}")
+        return
+
     corporation = EveCorporation.objects.get(external_id=corporation_id)
 
-    response = EveClient.call(op, corporation_id=corporation.external_id)
+    response = EveClient.call(
+        op, conditional=True, corporation_id=corporation.external_id)
+    if response.status in [200, 304]:
+        schedule_next_run(op, corporation_id, get_expires(response))
 
-    if response.status != 200:
+    if response.status == 304 and get_page_count(response) <= 1:
+        logger.info(
+            f"Skipping batch update {data_model.__name__} for {corporation_id}: Not modified")
+        return
+
+    if response.status not in [200, 304]:
         logger.error(
-            f"[{response.status}] Failed to batch update {data_model.__name__} for {character_id}: {response.header} {response.data}")
+            f"[{response.status}] Failed to batch update {data_model.__name__} for {corporation_id}: {response.header} {response.data}")
         return
 
-    items = response.data
+    try:
+        items, conditional_responses = get_conditional_paged_data(
+            op, response, corporation_id=corporation.external_id)
+    except EveServiceUnavailable as e:
+        logger.warning(
+            f"Skipping batch update {data_model.__name__} for {corporation_id}: {e.msg}")
+        EveClient.discard_conditional(
+            op, corporation_id=corporation.external_id)
+        return
 
-    if 'X-Pages' in response.header and response.header['X-Pages'][0] > 1:
-        for num in range(2, response.header['X-Pages'][0]+1):
-            response = EveClient.call(
-                op, corporation_id=corporation.external_id, page=num)
-            if response.status != 200:
-                continue
-            items += response.data
+    if items is None:
+        logger.info(
+            f"Skipping batch update {data_model.__name__} for {corporation_id}: Not modified")
+        return
 
     if len(items) == 0:
+        save_conditional_pages(
+            op, conditional_responses, corporation_id=corporation.external_id)
         return []
 
     if delete:
         data_model.objects.filter(entity=corporation).delete()
 
-    data_model.create_from_esi_response(items, corporation.external_id)
+    result = data_model.create_from_esi_response(items, corporation.external_id)
+    finish_conditional_pages(
+        op, conditional_responses, result, corporation_id=corporation.external_id)
 
     return items
@@ -1,5 +1,7 @@
 from .generic import MockResponseObject
 from django_eveonline_connector.tests.utilities import random_external_id
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
 
 
 def get_mock_affiliations_test_data(character_id1, character_id2, corporation_id):
@@ -14,5 +16,7 @@ def get_mock_affiliations_test_data(character_id1, character_id2, corporation_id
                 "character_id": character_id2,
                 "corporation_id": random_external_id()
             }
-        ]
+        ],
+        header={'Expires': [format_datetime(
+            datetime.now(timezone.utc) + timedelta(seconds=3600), usegmt=True)]}
     )
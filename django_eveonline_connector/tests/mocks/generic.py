@@ -1,6 +1,7 @@
 
 
 class MockResponseObject():
-    def __init__(self, status, data):
+    def __init__(self, status, data, header=None):
         self.status = status
         self.data = data
+        self.header = header or {}
@@ -1,6 +1,6 @@
 from django.test import TestCase, Client, TransactionTestCase
 from django.urls import reverse_lazy, reverse
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 from django_eveonline_connector.models import *
 from esipy import EsiClient
 from pyswagger.io import Response as PySwaggerResponse
@@ -10,7 +10,9 @@ from django.apps import AppConfig
 import django_eveonline_connector
 from django.core.cache import cache
 import uuid
+import time
 from unittest import skip
+from django_eveonline_connector.tests.mocks.generic import MockResponseObject
 
 # MOCK HELPERS 
 
@@ -35,6 +37,19 @@ def mock_eve_client_call_corporation_public_data(*args, **kwargs):
     }
     return obj
 
+def mock_esi_app(version, operations):
+    esi_app = MockObject()
+    esi_app.root = MockObject()
+    esi_app.root.info = MockObject()
+    esi_app.root.info.version = version
+    esi_app.op = {}
+    for operation_id, scope_names in operations.items():
+        operation = MockObject()
+        operation.operationId = operation_id
+        operation.security = [{'evesso': scope_names}] if scope_names else None
+        esi_app.op[operation_id] = operation
+    return esi_app
+
 # ESI
 class TestEveClient(TestCase):
     eve_client = None 
@@ -134,6 +149,22 @@ class TestEveClient(TestCase):
         client = EveClient.get_instance() 
         self.assertTrue("MOCKED" == client.esi_callback_url)
 
+    def test_eve_client_get_instance_memoized(self):
+        with self.assertNumQueries(1):
+            client = EveClient.get_instance()
+        with self.assertNumQueries(0):
+            self.assertIs(EveClient.get_instance(), client)
+
+        self.eve_client.esi_client_id = "UPDATED"
+        self.eve_client.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(EveClient.get_instance().esi_client_id, "UPDATED")
+
+        # another process saved the settings
+        cache.set('eve_client_version', uuid.uuid4().hex)
+        with self.assertNumQueries(1):
+            EveClient.get_instance()
+
     def test_eve_client_get_instance_failed(self):
         self.eve_client.delete()
         self.assertRaises(Exception, EveClient.get_instance)
@@ -144,9 +175,7 @@ class TestEveClient(TestCase):
     def test_eve_client_get_esi_app(self):
         esi_app = self.eve_client.get_esi_app()
         self.assertIsInstance(esi_app, pyswagger.core.App)
-        self.assertTrue('esi_app' in cache)
-        esi_app = self.eve_client.get_esi_app()
-        self.assertIsInstance(esi_app, pyswagger.core.App)
+        self.assertIs(self.eve_client.get_esi_app(), esi_app)
 
     @patch('django_eveonline_connector.models.EveClient.get_esi_security')
     def test_eve_client_get_esi_client(self, mock_get_esi_security):
@@ -159,11 +188,170 @@ class TestEveClient(TestCase):
         self.assertIsInstance(self.eve_client.get_esi_client(), esipy.EsiClient)
         self.assertIsInstance(self.eve_client.get_esi_client(self.eve_token), esipy.EsiClient)
 
+    def test_eve_client_build_scope_index(self):
+        known_scope = EveScope.objects.create(name="esi-test.read_known.v1")
+        esi_app = mock_esi_app("1.0", {
+            'get_test_known': ['esi-test.read_known.v1'],
+            'get_test_unknown': ['esi-test.read_unknown.v1'],
+            'get_test_public': [],
+        })
+        with self.assertLogs('django_eveonline_connector', level='ERROR'):
+            index = EveClient.build_scope_index(esi_app)
+        unknown_scope = EveScope.objects.get(name="esi-test.read_unknown.v1")
+        self.assertEqual(index['get_test_known'], frozenset([known_scope.pk]))
+        self.assertEqual(index['get_test_unknown'], frozenset([unknown_scope.pk]))
+        self.assertTrue('get_test_public' not in index)
+        with self.assertNumQueries(0):
+            self.assertEqual(EveClient.get_scope_index(esi_app), index)
+
     @patch('esipy.EsiSecurity.update_token')
     def test_eve_client_get_esi_security(self, mock_esi_security_update_token):
         self.assertIsInstance(self.eve_client.get_esi_security(), esipy.EsiSecurity)
         self.assertIsInstance(self.eve_client.get_esi_security(self.eve_token), esipy.EsiSecurity)
 
+class TestEsiConditionalRequests(TestCase):
+    def setUp(self):
+        from django_eveonline_connector.utilities.esi.etags import conditional_store
+        self.conditional_store = conditional_store
+        self.esi_app = mock_esi_app("1.0", {})
+        self.requests = []
+
+        def operation(**kwargs):
+            request = MockObject()
+            request._p = {'header': {}}
+            return (request, None)
+        self.esi_app.op['get_test_public'] = MagicMock(
+            side_effect=operation, operationId='get_test_public')
+
+    def tearDown(self):
+        self.conditional_store['store'] = None
+        cache.clear()
+
+    def mock_request(self, req_and_resp, token=None, raise_exception=False):
+        self.requests.append(dict(req_and_resp[0]._p['header']))
+        if 'If-None-Match' in req_and_resp[0]._p['header']:
+            return MockResponseObject(status=304, data=None)
+        return MockResponseObject(status=200, data=[1], header={
+            'ETag': ['"abc"'], 'Expires': ['Sun, 18 Oct 2026 12:00:00 GMT']})
+
+    def test_conditional_call(self):
+        from django_eveonline_connector.utilities.esi.etags import CacheConditionalStore, DatabaseConditionalStore
+        for store in [CacheConditionalStore(), DatabaseConditionalStore()]:
+            self.conditional_store['store'] = store
+            self.requests = []
+            with patch.object(EveClient, 'get_esi_app', return_value=self.esi_app), \
+                    patch.object(EveClient, 'get_scope_index', return_value={}), \
+                    patch.object(EveClient, 'request', side_effect=self.mock_request):
+                response = EveClient.call('get_test_public', conditional=True, page=1)
+                self.assertEqual(response.status, 200)
+                # the ETag is only stored once the data has been processed
+                self.assertEqual(EveClient.call('get_test_public', conditional=True, page=1).status, 200)
+                EveClient.save_conditional('get_test_public', response, page=1)
+                self.assertEqual(EveClient.call('get_test_public', conditional=True, page=1).status, 304)
+                self.assertEqual(EveClient.call('get_test_public', conditional=True, page=2).status, 200)
+                EveClient.discard_conditional('get_test_public', page=1)
+                self.assertEqual(EveClient.call('get_test_public', conditional=True, page=1).status, 200)
+            self.assertEqual(self.requests[1], {})
+            self.assertEqual(self.requests[2], {'If-None-Match': '"abc"'})
+            self.assertEqual(self.requests[3], {})
+            self.assertEqual(self.requests[4], {})
+
+
+class TestEsiErrorLimiter(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    @patch('django_eveonline_connector.utilities.esi.limiter.time.sleep')
+    def test_esi_error_limiter(self, mock_sleep):
+        from django_eveonline_connector.utilities.esi.limiter import EsiErrorLimiter
+        limiter = EsiErrorLimiter(slowdown=50, pause=10)
+
+        limiter.update({'X-Esi-Error-Limit-Remain': ['100'], 'X-Esi-Error-Limit-Reset': ['60']})
+        limiter.wait()
+        mock_sleep.assert_not_called()
+
+        with self.assertLogs('django_eveonline_connector', level='WARNING'):
+            limiter.update({'X-Esi-Error-Limit-Remain': ['20'], 'X-Esi-Error-Limit-Reset': ['60']})
+        limiter.wait()
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 3, places=0)
+
+        # workers share the budget, so the next call of another worker waits for the slot after it
+        other_limiter = EsiErrorLimiter(slowdown=50, pause=10)
+        other_limiter.wait()
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 6, places=0)
+        limiter.wait()
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 9, places=0)
+
+        limiter.update({'X-Esi-Error-Limit-Remain': ['5'], 'X-Esi-Error-Limit-Reset': ['60']})
+        with self.assertLogs('django_eveonline_connector', level='WARNING'):
+            limiter.wait()
+        self.assertAlmostEqual(mock_sleep.call_args[0][0], 60, places=0)
+
+        stats = limiter.stats
+        self.assertEqual(stats['remain'], 5)
+        self.assertEqual(stats['throttled'], 2)
+        self.assertEqual(stats['paused'], 1)
+
+
+class TestEveClientMissingScopes(TestCase):
+    def test_missing_scope_message_names_the_scope(self):
+        from django_eveonline_connector.exceptions import EveMissingScopeException
+        scope = EveScope.objects.create(name="esi-test.read_test.v1")
+        token = EveToken.objects.create()
+        esi_app = mock_esi_app("1.0", {'get_test': ["esi-test.read_test.v1"]})
+        with patch.object(EveClient, 'get_esi_app', return_value=esi_app), \
+                patch.object(EveClient, 'get_scope_index', return_value={'get_test': frozenset([scope.pk])}):
+            with self.assertRaises(EveMissingScopeException) as cm:
+                EveClient.call('get_test', token=token)
+        self.assertIn("esi-test.read_test.v1", cm.exception.msg)
+
+
+class TestEveClientCallMany(TestCase):
+    @patch('django_eveonline_connector.models.EveClient.call')
+    def test_eve_client_call_many(self, mock_eve_client_call):
+        def call(op, **kwargs):
+            if kwargs['page'] == 2:
+                raise Exception("ESI unavailable")
+            return MockResponseObject(status=200, data=[kwargs['page']])
+        mock_eve_client_call.side_effect = call
+
+        responses = EveClient.call_many(
+            [('get_test', {'page': page}) for page in range(1, 4)], max_workers=2)
+        self.assertEqual(responses[0].data, [1])
+        self.assertIsInstance(responses[1], Exception)
+        self.assertEqual(responses[2].data, [3])
+
+    @patch('django_eveonline_connector.models.EveClient.call')
+    def test_eve_client_acall(self, mock_eve_client_call):
+        import asyncio
+        mock_eve_client_call.side_effect = lambda op, **kwargs: MockResponseObject(
+            status=200, data=[kwargs['page']])
+
+        async def call_pages():
+            return await asyncio.gather(*[EveClient.acall('get_test', page=page) for page in range(1, 3)])
+
+        responses = asyncio.run(call_pages())
+        self.assertEqual([response.data for response in responses], [[1], [2]])
+
+
+class TestEsiClientPool(TestCase):
+    def test_esi_client_pool_reuses_clients(self):
+        from django_eveonline_connector.utilities.esi.pool import EsiClientPool
+        pool = EsiClientPool(factory=MockObject, size=1)
+        with pool.client() as client_a:
+            pass
+        with pool.client() as client_b:
+            self.assertIs(client_a, client_b)
+            with pool.client() as client_c:
+                self.assertIsNot(client_b, client_c)
+        self.assertEqual(pool.stats['hits'], 1)
+        self.assertEqual(pool.stats['misses'], 2)
+        self.assertEqual(pool.stats['idle'], 1)
+
+    def test_pooled_esi_client_has_no_response_cache(self):
+        from esipy.cache import DummyCache
+        self.assertIsInstance(EveClient.get_pooled_esi_client().cache, DummyCache)
+
 # SSO
 
 class TestEveToken(TestCase):
@@ -197,6 +385,21 @@ class TestEveToken(TestCase):
         self.eve_character.save() 
         self.assertTrue(self.eve_token.__str__() == "<%s:%s>" % (self.eve_character.name, self.user))
 
+    def test_eve_token_valid(self):
+        requested_scope = EveScope.objects.create(name="test_requested_scope")
+        self.eve_token.scopes.set(EveScope.objects.filter(required=True))
+        self.eve_token.requested_scopes.add(requested_scope)
+        self.assertFalse(self.eve_token.valid)
+        self.assertFalse(EveToken.objects.with_validity().get(pk=self.eve_token.pk).valid)
+        self.assertFalse(EveToken.objects.valid().filter(pk=self.eve_token.pk).exists())
+
+        self.eve_token.scopes.add(requested_scope)
+        self.assertTrue(self.eve_token.valid)
+        with self.assertNumQueries(2):
+            tokens = list(EveToken.objects.with_validity())
+            self.assertTrue(all(token.valid for token in tokens))
+        self.assertTrue(EveToken.objects.valid().filter(pk=self.eve_token.pk).exists())
+
     @patch('esipy.EsiSecurity.refresh')
     @patch('django_eveonline_connector.models.EveClient.get_esi_security')
     def test_eve_token_refresh(self, mock_get_esi_security, mock_esi_security_refresh):
@@ -217,6 +420,56 @@ class TestEveToken(TestCase):
             self.eve_token.refresh()
             self.assertTrue("Token refresh not needed" in cm.output[0])
 
+    @patch('django_eveonline_connector.models.EveClient.get_esi_security')
+    def test_eve_token_refresh_not_needed(self, mock_get_esi_security):
+        EveToken.objects.filter(pk=self.eve_token.pk).update(
+            expiry=timezone.now() + datetime.timedelta(minutes=10))
+        self.eve_token.refresh_from_db()
+        with self.assertNumQueries(0):
+            self.assertTrue(self.eve_token.refresh())
+        mock_get_esi_security.assert_not_called()
+
+    @patch('django_eveonline_connector.models.EveClient.get_esi_security')
+    def test_eve_token_refresh_coalesced(self, mock_get_esi_security):
+        EveToken.objects.filter(pk=self.eve_token.pk).update(
+            expiry=timezone.now() - datetime.timedelta(minutes=1))
+        self.eve_token.refresh_from_db()
+        lock_key = f"eve_token_refresh:{self.eve_token.pk}"
+        cache.add(lock_key, True)
+
+        def refreshed_elsewhere(seconds):
+            EveToken.objects.filter(pk=self.eve_token.pk).update(
+                access_token="REFRESHED", expiry=timezone.now() + datetime.timedelta(minutes=20))
+            cache.delete(lock_key)
+
+        with patch('django_eveonline_connector.models.time.sleep', side_effect=refreshed_elsewhere):
+            self.assertTrue(self.eve_token.refresh())
+        self.assertEqual(self.eve_token.access_token, "REFRESHED")
+        self.assertFalse(lock_key in cache)
+        mock_get_esi_security.assert_not_called()
+
+    @patch('django_eveonline_connector.models.TOKEN_REFRESH_LOCK_TIMEOUT', 0)
+    @patch('django_eveonline_connector.models.time.sleep')
+    @patch('django_eveonline_connector.models.EveClient.get_esi_security')
+    def test_eve_token_refresh_lock_timeout(self, mock_get_esi_security, mock_sleep):
+        EveToken.objects.filter(pk=self.eve_token.pk).update(
+            expiry=timezone.now() - datetime.timedelta(minutes=1))
+        self.eve_token.refresh_from_db()
+        lock_key = f"eve_token_refresh:{self.eve_token.pk}"
+        cache.add(lock_key, True)
+
+        # the lock of the other worker is left alone, and the token isn't refreshed alongside it
+        with self.assertLogs('django_eveonline_connector', level='WARNING'):
+            self.assertFalse(self.eve_token.refresh())
+        self.assertTrue(lock_key in cache)
+        mock_get_esi_security.assert_not_called()
+
+        from django_eveonline_connector.exceptions import EveTokenRefreshTimeout
+        with self.assertLogs('django_eveonline_connector', level='WARNING'):
+            self.assertRaises(EveTokenRefreshTimeout, self.eve_token.refresh, raise_on_timeout=True)
+        self.assertTrue(lock_key in cache)
+        cache.delete(lock_key)
+
 class TestEveScope(TestCase):
     eve_scope_a = None 
     eve_scope_b = None 
@@ -372,6 +625,194 @@ class TestEveJumpClone(TransactionTestCase):
         self.assertTrue(jump_clone.location == mock_resolve_location_from_location_id_location_type.return_value)
         self.assertTrue(jump_clone.implants == expected_implant_string)
 
+    @patch('django_eveonline_connector.models.resolve_type_id_to_type_name')
+    @patch('django_eveonline_connector.models.resolve_location_from_location_id_location_type')
+    def test_create_from_esi_rows(self, mock_resolve_location_from_location_id_location_type, mock_resolve_type_id_to_type_name):
+        eve_entity = EveEntity.objects.get(name="TEST_EJC")
+        mock_resolve_location_from_location_id_location_type.return_value = "My Location"
+        mock_resolve_type_id_to_type_name.return_value = "Random Implant"
+        bad_data_row = {"jump_clone_id": 1}
+        data_rows = [self.eve_data_row, bad_data_row, dict(self.eve_data_row, jump_clone_id=2)]
+        with self.assertLogs('django_eveonline_connector', level='WARNING') as cm:
+            failed_rows = EveJumpClone.create_from_esi_rows(data_rows, eve_entity.external_id)
+        self.assertEqual(failed_rows, [bad_data_row])
+        self.assertTrue("Failed to create" in cm.output[0])
+        self.assertEqual(EveJumpClone.objects.filter(entity=eve_entity).count(), 2)
+
+    @patch('django_eveonline_connector.models.resolve_type_id_to_type_name')
+    @patch('django_eveonline_connector.models.resolve_location_from_location_id_location_type')
+    def test_sync_from_esi_rows(self, mock_resolve_location_from_location_id_location_type, mock_resolve_type_id_to_type_name):
+        eve_entity = EveEntity.objects.get(name="TEST_EJC")
+        mock_resolve_location_from_location_id_location_type.return_value = "My Location"
+        mock_resolve_type_id_to_type_name.return_value = "Random Implant"
+        EveJumpClone.create_from_esi_rows(
+            [self.eve_data_row, dict(self.eve_data_row, jump_clone_id=1), dict(self.eve_data_row, jump_clone_id=2)],
+            eve_entity.external_id)
+
+        data_rows = [
+            self.eve_data_row,
+            dict(self.eve_data_row, jump_clone_id=1, location_id=1),
+            dict(self.eve_data_row, jump_clone_id=3),
+        ]
+        counts = EveJumpClone.sync_from_esi_rows(data_rows, eve_entity.external_id)
+        self.assertEqual(counts, {'created': 1, 'updated': 1, 'deleted': 1, 'unchanged': 1, 'failed': 0})
+        self.assertEqual(
+            sorted(EveJumpClone.objects.filter(entity=eve_entity).values_list('jump_clone_id', flat=True)),
+            [1, 3, self.eve_data_row['jump_clone_id']])
+        self.assertEqual(EveJumpClone.objects.get(jump_clone_id=1).location_id, 1)
+
+class TestEveContract(TestCase):
+    eve_data_row = {
+        "acceptor_id": 0,
+        "assignee_id": 2,
+        "availability": "personal",
+        "contract_id": 1,
+        "date_expired": "2020-01-08T00:00:00",
+        "date_issued": "2020-01-01T00:00:00",
+        "for_corporation": False,
+        "issuer_corporation_id": 3,
+        "issuer_id": 2,
+        "status": "outstanding",
+        "type": "item_exchange",
+    }
+    resolved_ids = {
+        0: {'name': "Nobody", 'type': "character"},
+        2: {'name': "TEST_CONTRACTS", 'type': "character"},
+        3: {'name': "TEST_CORPORATION", 'type': "corporation"},
+    }
+
+    def setUp(self):
+        self.eve_entity = EveEntity.objects.create(name="TEST_CONTRACTS", external_id=2)
+        EveContract.create_from_esi_rows(
+            [self.eve_data_row], self.eve_entity.external_id,
+            resolved_ids=self.resolved_ids, contract_items={})
+
+    @patch('django_eveonline_connector.models.resolve_type_ids')
+    @patch('django_eveonline_connector.models.EveClient.call_many')
+    def test_create_from_esi_response(self, mock_call_many, mock_resolve_type_ids):
+        mock_call_many.return_value = [
+            MockResponseObject(status=200, data=[{'quantity': 2, 'type_id': 34}, {'quantity': 1, 'type_id': 35}]),
+            Exception("ESI error"),
+        ]
+        mock_resolve_type_ids.return_value = {35: {'name': "Pyerite"}}
+        data = [
+            dict(self.eve_data_row, status="finished"),
+            dict(self.eve_data_row, contract_id=2),
+            dict(self.eve_data_row, contract_id=3),
+        ]
+        with self.assertLogs('django_eveonline_connector', level='ERROR'):
+            EveContract.create_from_esi_response(
+                data, self.eve_entity.external_id, resolved_ids=self.resolved_ids,
+                resolved_types={34: {'name': "Tritanium"}})
+
+        self.assertEqual(mock_call_many.call_count, 1)
+        self.assertEqual([call[1]['contract_id'] for call in mock_call_many.call_args[0][0]], [2, 3])
+        mock_resolve_type_ids.assert_called_once_with({35})
+        self.assertEqual(EveContract.objects.get(contract_id=1).status, "finished")
+        self.assertEqual(EveContract.objects.get(contract_id=2).items, "2 Tritanium\n1 Pyerite")
+        self.assertIsNone(EveContract.objects.get(contract_id=3).items)
+        self.assertEqual(EveContract.objects.get(contract_id=2).issuer_corporation_name, "TEST_CORPORATION")
+
+class MockDatetime():
+    def __init__(self, value):
+        self.value = value
+
+    def to_json(self):
+        return self.value
+
+
+class TestEveJournalEntry(TestCase):
+    resolved_ids = {
+        2: {'name': "TEST_JOURNAL", 'type': "character"},
+        3: {'name': "TEST_CORPORATION", 'type': "corporation"},
+    }
+
+    def setUp(self):
+        self.eve_character = EveCharacter.objects.create(
+            name="TEST_JOURNAL", external_id=2)
+
+    def journal_row(self, entry_id, day):
+        return {
+            'id': entry_id,
+            'date': MockDatetime(f"2020-01-{day:02d}T00:00:00"),
+            'description': "Bounty",
+            'ref_type': "bounty_prizes",
+            'amount': 10.0,
+            'first_party_id': 3,
+            'second_party_id': 2,
+        }
+
+    def test_create_from_esi_response(self):
+        EveJournalEntry.create_from_esi_response(
+            [self.journal_row(2, 2), self.journal_row(1, 1)],
+            self.eve_character.external_id, resolved_ids=self.resolved_ids)
+        self.assertEqual(EveJournalEntry.get_high_water_mark(self.eve_character.external_id), 2)
+        info = EveCharacterInfo.objects.get(character=self.eve_character)
+        self.assertEqual(info.journal_last_date, datetime.datetime(2020, 1, 2))
+        self.assertIsNotNone(info.journal_last_updated)
+
+        # only the rows above the high-water mark are resolved and inserted
+        with patch('django_eveonline_connector.models.resolve_ids_with_types',
+                   return_value=self.resolved_ids) as mock_resolve_ids_with_types:
+            EveJournalEntry.create_from_esi_response(
+                [self.journal_row(4, 4), self.journal_row(3, 3), self.journal_row(2, 2)],
+                self.eve_character.external_id)
+        mock_resolve_ids_with_types.assert_called_once_with({2, 3})
+        self.assertEqual(
+            sorted(EveJournalEntry.objects.values_list('external_id', flat=True)), [1, 2, 3, 4])
+        self.assertEqual(EveJournalEntry.get_high_water_mark(self.eve_character.external_id), 4)
+
+    def test_create_from_esi_response_failed_row(self):
+        with self.assertLogs('django_eveonline_connector', level='WARNING'):
+            EveJournalEntry.create_from_esi_response(
+                [self.journal_row(3, 3), {'id': 2, 'date': MockDatetime("2020-01-02T00:00:00")}, self.journal_row(1, 1)],
+                self.eve_character.external_id, resolved_ids=self.resolved_ids)
+        self.assertEqual(EveJournalEntry.get_high_water_mark(self.eve_character.external_id), 1)
+
+class TestEveTransaction(TestCase):
+    resolved_ids = {
+        3: {'name': "TEST_CLIENT", 'type': "character"},
+    }
+
+    def setUp(self):
+        self.eve_character = EveCharacter.objects.create(
+            name="TEST_TRANSACTIONS", external_id=2)
+
+    def transaction_row(self, transaction_id, location_id=60003760):
+        return {
+            'transaction_id': transaction_id,
+            'client_id': 3,
+            'date': MockDatetime("2020-01-01T00:00:00"),
+            'is_buy': True,
+            'is_personal': True,
+            'journal_ref_id': transaction_id,
+            'location_id': location_id,
+            'quantity': 1,
+            'type_id': 34,
+            'unit_price': 5.0,
+        }
+
+    @patch('django_eveonline_connector.models.resolve_locations')
+    def test_create_from_esi_response(self, mock_resolve_locations):
+        mock_resolve_locations.return_value = {60003760: "Jita IV - Moon 4 - Caldari Navy Assembly Plant"}
+        resolved = {'resolved_ids': self.resolved_ids, 'resolved_types': {34: {'name': "Tritanium"}}}
+        EveTransaction.create_from_esi_response(
+            [self.transaction_row(2), self.transaction_row(1, location_id=1000000000000)],
+            self.eve_character.external_id, **resolved)
+        mock_resolve_locations.assert_called_once_with(
+            {(60003760, None), (1000000000000, None)}, self.eve_character.external_id)
+        self.assertEqual(EveTransaction.objects.get(transaction_id=1).location_name, "Unknown Location")
+        self.assertEqual(EveTransaction.objects.get(transaction_id=2).item_name, "Tritanium")
+        self.assertEqual(EveTransaction.get_high_water_mark(self.eve_character.external_id), 2)
+
+        EveTransaction.create_from_esi_response(
+            [self.transaction_row(3, location_id=60008494), self.transaction_row(2)],
+            self.eve_character.external_id, **resolved)
+        mock_resolve_locations.assert_called_with({(60008494, None)}, self.eve_character.external_id)
+        self.assertEqual(EveTransaction.objects.count(), 3)
+        self.assertEqual(
+            EveCharacterInfo.objects.get(character=self.eve_character).transactions_last_id, 3)
+
 # OTHER
 class TestEveGroupRule(TestCase):
     def setUp(self):
@@ -442,4 +883,88 @@ class TestEveGroupRule(TestCase):
         self.excluded_user.groups.add(self.group)
         self.user.groups.add(self.group)
         self.eve_group_rule.characters.add(self.eve_character)
-        self.assertEqual(1, self.eve_group_rule.invalid_user_list.count())
\ No newline at end of file
+        self.assertEqual(1, self.eve_group_rule.invalid_user_list.count())
+
+class TestEsiSwaggerSnapshot(TestCase):
+    spec = {
+        'swagger': "2.0",
+        'info': {'title': "EVE Swagger Interface", 'version': "1.0"},
+        'host': "esi.evetech.net",
+        'basePath': "/latest",
+        'schemes': ["https"],
+        'paths': {
+            '/characters/{character_id}/': {
+                'get': {
+                    'operationId': "get_characters_character_id",
+                    'parameters': [{'name': "character_id", 'in': "path", 'required': True, 'type': "integer"}],
+                    'responses': {'200': {'description': "Public data", 'schema': {'type': "object"}}},
+                }
+            }
+        },
+    }
+
+    def setUp(self):
+        import tempfile
+        from django_eveonline_connector.utilities.esi import swagger
+        self.swagger = swagger
+        self.snapshot_dir = tempfile.TemporaryDirectory()
+        self.app_config = apps.get_app_config('django_eveonline_connector')
+        self.app_config.ESI_SWAGGER_DIR = self.snapshot_dir.name
+        swagger.clear_esi_app()
+
+    def tearDown(self):
+        self.app_config.ESI_SWAGGER_DIR = ""
+        self.swagger.clear_esi_app()
+        self.snapshot_dir.cleanup()
+
+    @patch('django_eveonline_connector.utilities.esi.swagger.requests.get', side_effect=Exception("offline"))
+    def test_load_esi_app_from_snapshot(self, mock_get):
+        self.swagger.write_snapshot(self.spec)
+        esi_app = EveClient.get_esi_app()
+        self.assertIn('get_characters_character_id', esi_app.op)
+        self.assertEqual(EveClient.get_swagger_version(esi_app), "1.0")
+        self.assertIs(EveClient.get_esi_app(), esi_app)
+        self.assertEqual(EveClient.get_esi_app_stats()['source'], "snapshot")
+        mock_get.assert_not_called()
+
+        # a newer snapshot is picked up on the next check, not on every call
+        spec = dict(self.spec, info={'title': "EVE Swagger Interface", 'version': "1.1"})
+        self.swagger.write_snapshot(spec)
+        self.assertIs(EveClient.get_esi_app(), esi_app)
+        self.swagger.esi_app_state['checked_at'] -= self.swagger.SNAPSHOT_CHECK_INTERVAL
+        self.assertEqual(EveClient.get_swagger_version(EveClient.get_esi_app()), "1.1")
+
+    @patch('django_eveonline_connector.utilities.esi.swagger.requests.get')
+    def test_load_esi_app_without_snapshot(self, mock_get):
+        mock_get.return_value.json.return_value = self.spec
+        esi_app = EveClient.get_esi_app()
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(EveClient.get_esi_app_stats()['source'], "network")
+        self.assertEqual(self.swagger.get_snapshot_version(), "1.0")
+
+    @patch('django_eveonline_connector.utilities.esi.swagger.requests.get')
+    def test_untrusted_snapshot_not_loaded(self, mock_get):
+        import os
+        mock_get.return_value.json.return_value = self.spec
+        self.swagger.write_snapshot(dict(self.spec, host="attacker.example"))
+        self.assertEqual(os.stat(self.swagger.get_pointer_path()).st_mode & 0o777, 0o600)
+
+        # a snapshot other users could have written is refused, and ESI is downloaded instead
+        os.chmod(self.snapshot_dir.name, 0o777)
+        with self.assertLogs('django_eveonline_connector', level='ERROR'):
+            esi_app = EveClient.get_esi_app()
+        self.assertEqual(EveClient.get_esi_app_stats()['source'], "network")
+        self.assertEqual(mock_get.call_count, 1)
+        os.chmod(self.snapshot_dir.name, 0o700)
+
+    @patch('django_eveonline_connector.utilities.esi.swagger.refresh_snapshot_in_background')
+    def test_stale_snapshot_refreshed_in_background(self, mock_refresh):
+        import os
+        self.swagger.write_snapshot(self.spec)
+        EveClient.get_esi_app()
+        mock_refresh.assert_not_called()
+        stale = time.time() - self.app_config.ESI_SWAGGER_MAX_AGE - 1
+        os.utime(self.swagger.get_pointer_path(), (stale, stale))
+        self.swagger.esi_app_state['checked_at'] -= self.swagger.SNAPSHOT_CHECK_INTERVAL
+        EveClient.get_esi_app()
+        mock_refresh.assert_called_once()
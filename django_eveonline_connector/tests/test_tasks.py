@@ -10,10 +10,22 @@ from django_eveonline_connector.tests.mocks.corporations import mock_corporation
 from django_eveonline_connector.tests.mocks.generic import MockResponseObject
 from django_eveonline_connector.tests.utilities import clean_eve_models, create_tracked_eve_character, create_tracked_eve_corporation, random_external_id, mock_raise_exception
 from unittest.mock import patch
+from django.core.cache import cache
 from datetime import timedelta
 import pytz
 
 
+def mock_affiliations_call(affiliations, corporation_status=200):
+    def call(op, *args, **kwargs):
+        if op == 'post_characters_affiliation':
+            return affiliations
+        return MockResponseObject(
+            status=corporation_status,
+            data={'name': "Test Corporation", 'ticker': "TEST"}
+        )
+    return call
+
+
 class TestEveTokenTasks(TestCase):
     def setUp(self):
         self.client = EveClient.objects.create(esi_callback_url="TEST",
@@ -84,6 +96,34 @@ class TestEveTokenTasks(TestCase):
         update_tokens()
         self.assertTrue(EveToken.objects.all().count() == 0)
 
+    def test_refresh_tokens_outcomes(self):
+        from django_eveonline_connector.utilities.esi.tokens import refresh_tokens
+        from django_eveonline_connector.exceptions import EveTokenRefreshTimeout
+        tokens = [EveToken.objects.create() for _ in range(5)]
+        EveToken.objects.filter(pk__in=[token.pk for token in tokens[1:]]).update(
+            expiry=timezone.now() - timedelta(minutes=1))
+        EveToken.objects.filter(pk=tokens[0].pk).update(
+            expiry=timezone.now() + timedelta(minutes=10))
+
+        def refresh(token, raise_on_timeout=False):
+            if token.pk == tokens[3].pk:
+                raise Exception("SSO unavailable")
+            if token.pk == tokens[4].pk:
+                raise EveTokenRefreshTimeout("Timed out")
+            return token.pk == tokens[1].pk
+        with patch.object(EveToken, 'refresh', autospec=True, side_effect=refresh):
+            with self.assertLogs('django_eveonline_connector.utilities.esi.tokens', level='ERROR'):
+                results = refresh_tokens(
+                    EveToken.objects.filter(pk__in=[token.pk for token in tokens]), rate=0)
+
+        self.assertEqual(results, {
+            tokens[0].pk: 'skipped',
+            tokens[1].pk: 'refreshed',
+            tokens[2].pk: 'invalid_grant',
+            tokens[3].pk: 'error',
+            tokens[4].pk: 'lock_timeout',
+        })
+
 
 class EveGroupTest(TestCase):
     def setUp(self):
@@ -140,21 +180,31 @@ class TestEveCharacterTasks(TestCase):
 
     def tearDown(self):
         clean_eve_models()
+        cache.clear()
 
     @patch('django_eveonline_connector.tasks.update_character')
     def test_update_characters(self, mock_update_character):
         from django_eveonline_connector.tasks import update_characters
-        mock_update_character.return_value = None
-        update_characters()
-        self.assertTrue(True)
+        self.assertEqual(update_characters(), 2)
+        queued_ids = mock_update_character.chunks.call_args[0][0]
+        self.assertCountEqual(queued_ids, [
+            (character.external_id,) for character in self.valid_characters])
+        mock_update_character.chunks.return_value.group.return_value.apply_async.assert_called_once()
+
+        # characters whose datasets are all cached by ESI are not queued
+        from django_eveonline_connector.tasks import CHARACTER_DATASETS
+        from django_eveonline_connector.utilities.esi.schedule import schedule_next_run
+        for op, data_model in CHARACTER_DATASETS:
+            schedule_next_run(op, self.valid_characters[1].external_id,
+                              timezone.now() + timedelta(minutes=5))
+        self.assertEqual(update_characters(), 1)
+        self.assertEqual(mock_update_character.chunks.call_args[0][0], [
+            (self.valid_characters[0].external_id,)])
 
-    @patch('django_eveonline_connector.models.EveCorporation.create_from_external_id')
     @patch('django_eveonline_connector.tasks.EveClient.call')
-    def test_update_affiliations(self, mock_eve_client, mock_create_eve_corporation):
+    def test_update_affiliations(self, mock_eve_client):
         from django_eveonline_connector.tasks import update_affiliations
 
-        mock_create_eve_corporation.side_effect = mock_corporation_create_from_external_id
-
         character_a = EveCharacter.objects.create(
             external_id=random_external_id(), name="Character A")
         character_b = EveCharacter.objects.create(
@@ -162,11 +212,11 @@ class TestEveCharacterTasks(TestCase):
         corporation_a = EveCorporation.objects.create(
             external_id=random_external_id(), name="Corporation A")
 
-        mock_eve_client.return_value = get_mock_affiliations_test_data(
-            character_a.external_id, character_b.external_id, corporation_a.external_id)
+        mock_eve_client.side_effect = mock_affiliations_call(get_mock_affiliations_test_data(
+            character_a.external_id, character_b.external_id, corporation_a.external_id))
 
         # normal run
-        update_affiliations()
+        self.assertEqual(update_affiliations(), 2)
         character_a.refresh_from_db()
         character_b.refresh_from_db()
 
@@ -179,25 +229,42 @@ class TestEveCharacterTasks(TestCase):
             character_b.corporation != corporation_a
         )
 
-        # check that characters are skipped
-        update_affiliations()
+        # check that runs within the ESI cache window are skipped
+        call_count = mock_eve_client.call_count
+        self.assertEqual(update_affiliations(), 0)
+        self.assertEqual(mock_eve_client.call_count, call_count)
+
+        # check that unchanged characters are skipped
+        cache.clear()
+        self.assertEqual(update_affiliations(), 0)
+        self.assertTrue(mock_eve_client.call_count > call_count)
 
-    @patch('django_eveonline_connector.models.EveCharacter.update_character_corporation')
     @patch('django_eveonline_connector.tasks.EveClient.call')
-    def test_update_affiliations_raised_exception(self, mock_eve_client, mock_update_character_corporation):
+    def test_update_affiliations_esi_error(self, mock_eve_client):
+        from django_eveonline_connector.tasks import update_affiliations
+        EveCharacter.objects.create(
+            external_id=random_external_id(), name="Character A")
+        mock_eve_client.return_value = MockResponseObject(status=502, data={})
+
+        # runs after a failed call are not skipped
+        with self.assertLogs('django_eveonline_connector', level='ERROR'):
+            self.assertEqual(update_affiliations(), 0)
+        call_count = mock_eve_client.call_count
+        with self.assertLogs('django_eveonline_connector', level='ERROR'):
+            self.assertEqual(update_affiliations(), 0)
+        self.assertTrue(mock_eve_client.call_count > call_count)
+
+    @patch('django_eveonline_connector.tasks.EveClient.call')
+    def test_update_affiliations_raised_exception(self, mock_eve_client):
         from django_eveonline_connector.tasks import update_affiliations
 
         character_a = EveCharacter.objects.create(
             external_id=random_external_id(), name="Character A")
         character_b = EveCharacter.objects.create(
             external_id=random_external_id(), name="Character B")
-        corporation_a = EveCorporation.objects.create(
-            external_id=random_external_id(), name="Corporation A")
 
-        mock_eve_client.return_value = get_mock_affiliations_test_data(
-            character_a.external_id, character_b.external_id, corporation_a.external_id)
-
-        mock_update_character_corporation.side_effect = mock_raise_exception
+        mock_eve_client.side_effect = mock_affiliations_call(get_mock_affiliations_test_data(
+            character_a.external_id, character_b.external_id, random_external_id()), corporation_status=500)
 
         with self.assertLogs('django_eveonline_connector.tasks', level='ERROR') as cm:
             update_affiliations()
@@ -206,34 +273,131 @@ class TestEveCharacterTasks(TestCase):
 
     @patch('django_eveonline_connector.models.EveCharacter.update_character_corporation_roles')
     @patch('django_eveonline_connector.models.EveCharacter.update_character_corporation')
-    @patch('django_eveonline_connector.tasks.update_character_transactions')
-    @patch('django_eveonline_connector.tasks.update_character_skills')
-    @patch('django_eveonline_connector.tasks.update_character_jumpclones')
-    @patch('django_eveonline_connector.tasks.update_character_journal')
-    @patch('django_eveonline_connector.tasks.update_character_contracts')
-    @patch('django_eveonline_connector.tasks.update_character_contacts')
-    @patch('django_eveonline_connector.tasks.update_character_assets')
+    @patch('django_eveonline_connector.tasks.sync_character_data')
     def test_update_character(self,
-                              mock_update_character_assets,
-                              mock_update_character_contacts,
-                              mock_update_character_contracts,
-                              mock_update_character_journal,
-                              mock_update_character_jumpclones,
-                              mock_update_character_skills,
-                              mock_update_character_transactions,
+                              mock_sync_character_data,
                               mock_update_character_corporation,
                               mock_update_character_corporation_roles
                               ):
         from django_eveonline_connector.tasks import update_character
-        mock_update_character_assets.return_value = None
-        mock_update_character_contacts.return_value = None
-        mock_update_character_contracts.return_value = None
-        mock_update_character_journal.return_value = None
-        mock_update_character_skills.return_value = None
-        mock_update_character_transactions.return_value = None
+        mock_sync_character_data.return_value = {}
         mock_update_character_corporation.return_value = None
         mock_update_character_corporation_roles.return_value = None
-        update_character(3)
+        self.assertEqual(update_character(3), {})
+        self.assertEqual(
+            mock_sync_character_data.call_args[0][0].external_id, 3)
+        mock_update_character_corporation.assert_called_once()
+        mock_update_character_corporation_roles.assert_called_once()
+
+    @patch('django_eveonline_connector.tasks.sync_character_eveentitydata')
+    @patch('django_eveonline_connector.tasks.update_character_eveentitydata')
+    @patch('django_eveonline_connector.tasks.resolve_locations')
+    @patch('django_eveonline_connector.tasks.resolve_ids_with_types')
+    @patch('django_eveonline_connector.tasks.resolve_type_ids')
+    @patch('django_eveonline_connector.tasks.get_character_eveentitydata')
+    @patch('django_eveonline_connector.tasks.EveClient.get_esi_app')
+    @patch('django_eveonline_connector.tasks.EveClient.get_scope_index')
+    def test_sync_character_data(self,
+                                 mock_get_scope_index,
+                                 mock_get_esi_app,
+                                 mock_get_character_eveentitydata,
+                                 mock_resolve_type_ids,
+                                 mock_resolve_ids_with_types,
+                                 mock_resolve_locations,
+                                 mock_update_character_eveentitydata,
+                                 mock_sync_character_eveentitydata
+                                 ):
+        from django_eveonline_connector.tasks import sync_character_data
+        from django_eveonline_connector.models import EveAsset, EveContact, EveTransaction
+        mock_get_scope_index.return_value = {}
+        data = {
+            EveAsset: [{'type_id': 34, 'location_id': 60003760, 'location_type': 'station', 'location_flag': 'Hangar'}],
+            EveContact: [{'contact_id': 1}],
+            EveTransaction: [{'type_id': 35, 'client_id': 2, 'location_id': 60008494}],
+        }
+        mock_get_character_eveentitydata.side_effect = lambda op, data_model, character_id, token=None: (
+            data.get(data_model), {})
+
+        character = self.valid_characters[0]
+        EveToken.objects.filter(pk=character.token.pk).update(
+            expiry=timezone.now() + timedelta(minutes=10))
+        results = sync_character_data(character)
+
+        self.assertEqual(mock_get_character_eveentitydata.call_count, 7)
+        mock_resolve_type_ids.assert_called_once_with({34, 35})
+        mock_resolve_ids_with_types.assert_called_once_with({1, 2})
+        mock_resolve_locations.assert_called_once_with(
+            {(60003760, 'station'), (60008494, None)}, character.external_id)
+        for call in mock_sync_character_eveentitydata.call_args_list + mock_update_character_eveentitydata.call_args_list:
+            self.assertEqual(
+                call[1]['resolved_types'], mock_resolve_type_ids.return_value)
+            self.assertEqual(
+                call[1]['resolved_ids'], mock_resolve_ids_with_types.return_value)
+            self.assertEqual(
+                call[1]['resolved_locations'], mock_resolve_locations.return_value)
+        self.assertEqual(len(results), 7)
+
+
+    @patch('django_eveonline_connector.tasks.resolve_locations')
+    @patch('django_eveonline_connector.tasks.resolve_ids_with_types')
+    @patch('django_eveonline_connector.tasks.resolve_type_ids')
+    @patch('django_eveonline_connector.tasks.EveClient.call')
+    @patch('django_eveonline_connector.tasks.EveClient.get_esi_app')
+    @patch('django_eveonline_connector.tasks.EveClient.get_scope_index')
+    def test_sync_character_data_unchanged_or_failed(self,
+                                                     mock_get_scope_index,
+                                                     mock_get_esi_app,
+                                                     mock_eve_client_call,
+                                                     mock_resolve_type_ids,
+                                                     mock_resolve_ids_with_types,
+                                                     mock_resolve_locations
+                                                     ):
+        from django_eveonline_connector.tasks import sync_character_data, CHARACTER_DATASETS
+        mock_get_scope_index.return_value = {}
+        character = self.valid_characters[0]
+        EveToken.objects.filter(pk=character.token.pk).update(
+            expiry=timezone.now() + timedelta(minutes=10))
+
+        # datasets that are unchanged or failed are not fetched again to be written
+        for status in [304, 403]:
+            mock_eve_client_call.reset_mock()
+            mock_eve_client_call.return_value = MockResponseObject(status=status, data={})
+            with self.assertLogs('django_eveonline_connector', level='INFO'):
+                results = sync_character_data(character)
+            self.assertEqual(mock_eve_client_call.call_count, len(CHARACTER_DATASETS))
+            self.assertEqual(results, {data_model.__name__: None for op, data_model in CHARACTER_DATASETS})
+
+    @patch('django_eveonline_connector.tasks.discard_conditional_pages')
+    @patch('django_eveonline_connector.tasks.save_conditional_pages')
+    @patch('django_eveonline_connector.models.EveContact._create_from_esi_response')
+    def test_update_character_eveentitydata_etags(self,
+                                                  mock_create_from_esi_response,
+                                                  mock_save_conditional_pages,
+                                                  mock_discard_conditional_pages
+                                                  ):
+        from django_eveonline_connector.tasks import update_character_eveentitydata
+        from django_eveonline_connector.models import EveContact
+        op = 'get_characters_character_id_contacts'
+        character_id = self.valid_characters[0].external_id
+        conditional_responses = {1: MockResponseObject(status=200, data=[{'contact_id': 1}])}
+
+        # ETags are saved once the data has been written
+        mock_create_from_esi_response.return_value = []
+        update_character_eveentitydata(
+            op, EveContact, character_id, items=[{'contact_id': 1}], conditional_responses=conditional_responses)
+        mock_save_conditional_pages.assert_called_once_with(
+            op, conditional_responses, character_id=character_id)
+        mock_discard_conditional_pages.assert_not_called()
+
+        # and forgotten when the write failed, so the next run doesn't get a 304
+        mock_save_conditional_pages.reset_mock()
+        mock_create_from_esi_response.side_effect = Exception("Failed")
+        with self.assertLogs('django_eveonline_connector', level='ERROR'):
+            update_character_eveentitydata(
+                op, EveContact, character_id, items=[{'contact_id': 1}], conditional_responses=conditional_responses)
+        mock_save_conditional_pages.assert_not_called()
+        mock_discard_conditional_pages.assert_called_once_with(
+            op, conditional_responses, character_id=character_id)
 
 
 class TestEveCorporationTasks(TestCase):
@@ -377,3 +541,82 @@ class TestEveAllianceTasks(TestCase):
         update_alliance(self.alliance.external_id)
         self.assertTrue(EveAlliance.objects.get(
             external_id=self.alliance.external_id).executor.external_id, corporation_id)
+
+
+class TestEsiPages(TestCase):
+    @patch('django_eveonline_connector.utilities.esi.pages.EveClient.call')
+    def test_get_paged_data(self, mock_eve_client_call):
+        from django_eveonline_connector.utilities.esi.pages import get_paged_data
+        failures = {3: 1}
+
+        def mock_page(op, page, **kwargs):
+            if failures.get(page):
+                failures[page] -= 1
+                return MockResponseObject(status=502, data={})
+            return MockResponseObject(status=200, data=[page])
+
+        mock_eve_client_call.side_effect = mock_page
+        response = MockResponseObject(
+            status=200, data=[1], header={'X-Pages': [4]})
+        self.assertEqual(get_paged_data('op', response, character_id=1), [1, 2, 3, 4])
+
+    @patch('django_eveonline_connector.utilities.esi.pages.EveClient.call')
+    def test_get_paged_data_failed_page(self, mock_eve_client_call):
+        from django_eveonline_connector.utilities.esi.pages import get_paged_data
+        from django_eveonline_connector.exceptions import EveServiceUnavailable
+        mock_eve_client_call.return_value = MockResponseObject(status=504, data={})
+        response = MockResponseObject(
+            status=200, data=[1], header={'X-Pages': [2]})
+        with self.assertLogs('django_eveonline_connector', level='WARNING'):
+            self.assertRaises(EveServiceUnavailable, get_paged_data,
+                              'op', response, character_id=1)
+
+    @patch('django_eveonline_connector.utilities.esi.pages.EveClient.call')
+    def test_get_paged_data_until(self, mock_eve_client_call):
+        from django_eveonline_connector.utilities.esi.pages import get_paged_data_until
+        mock_eve_client_call.side_effect = lambda op, page, **kwargs: MockResponseObject(
+            status=200, data=[100 - page * 10, 95 - page * 10])
+        response = MockResponseObject(
+            status=200, data=[90, 85], header={'X-Pages': [6]})
+        items = get_paged_data_until(
+            'op', response, lambda row: row <= 70, max_workers=2, character_id=1)
+        self.assertEqual(items, [90, 85, 80, 75, 70, 65])
+        self.assertEqual(mock_eve_client_call.call_count, 2)
+
+    @patch('django_eveonline_connector.utilities.esi.pages.EveClient.call')
+    def test_get_from_id_data(self, mock_eve_client_call):
+        from django_eveonline_connector.utilities.esi.pages import get_from_id_data
+        # ESI returns the rows before from_id; the row at from_id is included here to check de-duplication
+        mock_eve_client_call.side_effect = lambda op, from_id, **kwargs: MockResponseObject(
+            status=200, data=[{'id': from_id}, {'id': from_id - 1}, {'id': from_id - 5}])
+        response = MockResponseObject(status=200, data=[{'id': 30}, {'id': 25}])
+        items = get_from_id_data(
+            'op', response, 'id', lambda row: row['id'] <= 15, character_id=1)
+        self.assertEqual([row['id'] for row in items], [30, 25, 24, 20, 19, 15])
+        self.assertEqual([call[1]['from_id'] for call in mock_eve_client_call.call_args_list], [25, 20])
+
+    @patch('django_eveonline_connector.utilities.esi.pages.EveClient.call')
+    def test_get_conditional_paged_data(self, mock_eve_client_call):
+        from django_eveonline_connector.utilities.esi.pages import get_conditional_paged_data
+
+        def mock_page(op, page, conditional=False, **kwargs):
+            # page 2 changed, pages 1 and 3 are unchanged
+            if conditional and page != 2:
+                return MockResponseObject(status=304, data=None)
+            return MockResponseObject(status=200, data=[page])
+
+        mock_eve_client_call.side_effect = mock_page
+        response = MockResponseObject(
+            status=304, data=None, header={'X-Pages': [3]})
+        items, responses = get_conditional_paged_data('op', response, character_id=1)
+        self.assertEqual(items, [1, 2, 3])
+        self.assertEqual(sorted(responses), [1, 2, 3])
+        self.assertTrue(all(page_response.status == 200 for page_response in responses.values()))
+        # unchanged pages are fetched again without If-None-Match
+        self.assertEqual(sorted((call[1]['page'], call[1]['conditional']) for call in mock_eve_client_call.call_args_list),
+                         [(1, False), (2, True), (3, False), (3, True)])
+
+        # data only counts as unchanged when every page returned 304
+        mock_eve_client_call.side_effect = lambda op, page, conditional=False, **kwargs: MockResponseObject(
+            status=304, data=None)
+        self.assertEqual(get_conditional_paged_data('op', response, character_id=1), (None, {}))
@@ -0,0 +1,176 @@
+from django.test import TestCase
+from unittest.mock import patch
+from django_eveonline_connector.tests.mocks.generic import MockResponseObject
+from django_eveonline_connector.utilities.static.cache import (static_resolver_cache, invalidate_static_cache,
+                                                               get_static_cache_stats)
+from django_eveonline_connector.utilities.static.universe import resolve_type_id_to_type_name
+
+
+class TestStaticResolverCache(TestCase):
+    def setUp(self):
+        invalidate_static_cache()
+
+    def tearDown(self):
+        invalidate_static_cache()
+
+    @patch('django_eveonline_connector.utilities.static.universe.query_static_database')
+    def test_resolver_is_memoized(self, mock_query_static_database):
+        mock_query_static_database.return_value = "Tritanium"
+        self.assertEqual(resolve_type_id_to_type_name(34), "Tritanium")
+        self.assertEqual(resolve_type_id_to_type_name(34), "Tritanium")
+        self.assertEqual(mock_query_static_database.call_count, 1)
+        self.assertEqual(get_static_cache_stats()['hits'], 1)
+
+        invalidate_static_cache(sde_version="TEST")
+        self.assertEqual(resolve_type_id_to_type_name(34), "Tritanium")
+        self.assertEqual(mock_query_static_database.call_count, 2)
+        self.assertEqual(get_static_cache_stats()['sde_version'], "TEST")
+
+    def test_cache_is_bounded(self):
+        maxsize = static_resolver_cache.maxsize
+        static_resolver_cache.maxsize = 2
+        try:
+            for key in range(3):
+                static_resolver_cache.set(key, key)
+            self.assertRaises(KeyError, static_resolver_cache.get, 0)
+            self.assertEqual(static_resolver_cache.get(2), 2)
+        finally:
+            static_resolver_cache.maxsize = maxsize
+
+
+class TestStaticTypeTable(TestCase):
+    def test_lookup_table(self):
+        from django_eveonline_connector.utilities.static.tables import StaticLookupTable
+        table = StaticLookupTable([(35, 18, "Pyerite"), (34, 18, "Tritanium")],
+                                  int_columns=['group_id'], text_columns=['name'])
+        self.assertEqual(table.get(34, 'name'), "Tritanium")
+        self.assertEqual(table.get("35", 'group_id'), 18)
+        self.assertEqual(table.get(36, 'name'), None)
+        self.assertTrue(table.memory_footprint > 0)
+
+    def test_disabled_table(self):
+        from django_eveonline_connector.utilities.static.tables import StaticTypeTable
+        table = StaticTypeTable(enabled=False)
+        self.assertEqual(table.lookup('types', 34, 'name'), None)
+        self.assertFalse(table.loaded)
+
+
+class TestResolveTypeIds(TestCase):
+    def setUp(self):
+        invalidate_static_cache()
+
+    def tearDown(self):
+        invalidate_static_cache()
+
+    @patch('django_eveonline_connector.utilities.static.universe.resolve_type_ids_using_esi')
+    @patch('django_eveonline_connector.utilities.static.universe.query_static_database')
+    def test_resolve_type_ids(self, mock_query_static_database, mock_resolve_type_ids_using_esi):
+        from django_eveonline_connector.utilities.static.universe import resolve_type_ids
+        mock_query_static_database.return_value = [
+            (34, "Tritanium", 18, "Mineral", 4, "Material")]
+        mock_resolve_type_ids_using_esi.return_value = {
+            35: {'name': "Pyerite", 'group_id': 18, 'group_name': "Mineral",
+                 'category_id': 4, 'category_name': "Material"}}
+        resolved = resolve_type_ids([34, 34, 35])
+        self.assertEqual(resolved[34]['name'], "Tritanium")
+        self.assertEqual(resolved[35]['category_name'], "Material")
+        self.assertEqual(mock_query_static_database.call_count, 1)
+        mock_resolve_type_ids_using_esi.assert_called_once_with({35})
+
+        # warmed the single type_id resolvers
+        self.assertEqual(resolve_type_id_to_type_name(35), "Pyerite")
+        self.assertEqual(resolve_type_ids([34, 35]), resolved)
+        self.assertEqual(mock_query_static_database.call_count, 1)
+
+
+class TestResolveIdsWithTypes(TestCase):
+    def setUp(self):
+        from django_eveonline_connector.utilities.esi.names import name_cache
+        name_cache.clear()
+
+    def tearDown(self):
+        from django_eveonline_connector.utilities.esi.names import name_cache
+        name_cache.clear()
+
+    @patch('django_eveonline_connector.utilities.esi.universe.EveClient.call')
+    def test_resolve_ids_with_types(self, mock_eve_client_call):
+        from django_eveonline_connector.models import EveCorporation, EveName
+        from django_eveonline_connector.utilities.esi.names import name_cache
+        from django_eveonline_connector.utilities.esi.universe import resolve_ids_with_types, resolve_ids
+        EveCorporation.objects.create(external_id=98000001, name="Known Corporation")
+        mock_eve_client_call.return_value = MockResponseObject(status=200, data=[
+            {'id': 1000125, 'name': "CONCORD", 'category': "corporation"}])
+
+        resolved = resolve_ids_with_types([98000001, 1000125])
+        self.assertEqual(resolved[98000001], {'name': "Known Corporation", 'type': "corporation"})
+        self.assertEqual(resolved[1000125], {'name': "CONCORD", 'type': "corporation"})
+        self.assertEqual(mock_eve_client_call.call_args[1]['ids'], [1000125])
+        self.assertTrue(EveName.objects.filter(external_id=1000125).exists())
+
+        # served by the process cache, then by the database
+        self.assertEqual(resolve_ids([1000125]), {1000125: "CONCORD"})
+        name_cache.clear()
+        self.assertEqual(resolve_ids_with_types([98000001, 1000125]), resolved)
+        self.assertEqual(mock_eve_client_call.call_count, 1)
+
+
+    def test_store_names(self):
+        from django.db import IntegrityError
+        from django_eveonline_connector.models import EveName
+        from django_eveonline_connector.utilities.esi.names import store_names
+        EveName.objects.create(external_id=1000125, name="Old Name", category="corporation")
+
+        store_names({1000125: {'name': "CONCORD", 'type': "corporation"},
+                     3019582: {'name': "Agent", 'type': "character"}})
+        self.assertEqual(EveName.objects.get(external_id=1000125).name, "CONCORD")
+        self.assertEqual(EveName.objects.get(external_id=3019582).name, "Agent")
+
+        # a failed write is logged and doesn't fail name resolution
+        with patch.object(EveName.objects, 'bulk_create', side_effect=IntegrityError), \
+                self.assertLogs('django_eveonline_connector', level='ERROR'):
+            store_names({3019583: {'name': "Other Agent", 'type': "character"}})
+        self.assertFalse(EveName.objects.filter(external_id=3019583).exists())
+
+
+class TestResolveLocations(TestCase):
+    def setUp(self):
+        from django_eveonline_connector.models import EveEntity, EveStructure
+        entity = EveEntity.objects.create(name="TEST_CORPORATION", external_id=3)
+        EveStructure.objects.create(
+            entity=entity, corporation_id=3, profile_id=1, reinforce_hour=0, state="shield_vulnerable",
+            structure_id=1000000000001, system_id=30000142, owner_id=3, solar_system_id=30000142,
+            name="Jita - Test Keepstar")
+
+    def tearDown(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    @patch('django_eveonline_connector.utilities.static.universe.get_system_id')
+    @patch('django_eveonline_connector.utilities.static.universe.query_static_database')
+    def test_resolve_locations(self, mock_query_static_database, mock_get_system_id):
+        from django_eveonline_connector.utilities.static.universe import resolve_locations
+        mock_query_static_database.side_effect = lambda query, **kwargs: (
+            [(60003760, "Jita IV - Moon 4 - Caldari Navy Assembly Plant")] if "staStations" in query else [])
+        mock_get_system_id.return_value = {'name': "Jita"}
+        locations = {
+            (60003760, 'station'),
+            (30000142, 'solar_system'),
+            (1000000000001, 'item'),
+            (1000000000002, 'other'),
+            (2004, 'other'),
+        }
+        expected = {
+            60003760: "Jita IV - Moon 4 - Caldari Navy Assembly Plant",
+            30000142: "Jita",
+            1000000000001: "Jita - Test Keepstar",
+            1000000000002: "Unknown Structure",
+            2004: "Asset Safety",
+        }
+        self.assertEqual(resolve_locations(locations, 1), expected)
+        self.assertEqual(mock_query_static_database.call_count, 2)
+        mock_get_system_id.assert_called_once_with(30000142)
+
+        # stations and solar systems are served from the shared cache
+        self.assertEqual(resolve_locations(locations, 1), expected)
+        self.assertEqual(mock_query_static_database.call_count, 2)
+        mock_get_system_id.assert_called_once_with(30000142)
@@ -0,0 +1,133 @@
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from email.utils import parsedate_to_datetime
+import hashlib
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+
+class EsiConditionalStore():
+    """
+    Stores the ETag and Expires header of ESI responses, keyed by operation and parameters.
+    Used by EveClient.call(conditional=True) to send If-None-Match.
+    """
+
+    def get(self, key):
+        """
+        Returns a dict with `etag` and `expires`, or None.
+        """
+        raise NotImplementedError
+
+    def set(self, key, etag, expires=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class CacheConditionalStore(EsiConditionalStore):
+    """
+    Keeps ETags in the Django cache.
+    """
+    prefix = "esi_etag"
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout
+
+    def get(self, key):
+        return cache.get(f"{self.prefix}:{key}")
+
+    def set(self, key, etag, expires=None):
+        cache.set(f"{self.prefix}:{key}", {'etag': etag, 'expires': expires},
+                  timeout=self.timeout)
+
+    def delete(self, key):
+        cache.delete(f"{self.prefix}:{key}")
+
+
+class DatabaseConditionalStore(EsiConditionalStore):
+    """
+    Keeps ETags in the EveEsiEtag table, so they survive cache flushes.
+    """
+
+    def __init__(self, timeout=None):
+        self.model = apps.get_model('django_eveonline_connector', 'EveEsiEtag')
+
+    def get(self, key):
+        return self.model.objects.filter(key=key).values('etag', 'expires').first()
+
+    def set(self, key, etag, expires=None):
+        self.model.objects.update_or_create(
+            key=key, defaults={'etag': etag, 'expires': expires})
+
+    def delete(self, key):
+        self.model.objects.filter(key=key).delete()
+
+
+CONDITIONAL_STORES = {
+    'cache': CacheConditionalStore,
+    'database': DatabaseConditionalStore,
+}
+
+conditional_store = {
+    'store': None,
+}
+
+
+def get_conditional_store():
+    """
+    Returns the store configured by ESI_ETAG_STORE: "cache", "database", a dotted path to an
+    EsiConditionalStore subclass, or an empty string to disable conditional requests.
+    """
+    if conditional_store['store'] is None:
+        app_config = apps.get_app_config('django_eveonline_connector')
+        store_name = app_config.ESI_ETAG_STORE
+        if not store_name:
+            return None
+        if store_name in CONDITIONAL_STORES:
+            store_class = CONDITIONAL_STORES[store_name]
+        else:
+            store_class = import_string(store_name)
+        conditional_store['store'] = store_class(
+            timeout=app_config.ESI_ETAG_TIMEOUT)
+    return conditional_store['store']
+
+
+def make_conditional_key(operation_id, kwargs):
+    """
+    Builds the store key of an ESI call from its operation ID and parameters (including the character or corporation ID).
+    """
+    parameters = json.dumps(sorted(kwargs.items()), default=str)
+    return hashlib.sha1(f"{operation_id}:{parameters}".encode()).hexdigest()
+
+
+def get_header(response, name):
+    """
+    Returns the first value of a response header, matched case-insensitively.
+    """
+    return find_header(response.header, name)
+
+
+def find_header(headers, name):
+    for key, value in (headers or {}).items():
+        if key.lower() == name.lower():
+            return value[0] if isinstance(value, (list, tuple)) else value
+    return None
+
+
+def get_expires(response):
+    expires = get_header(response, 'Expires')
+    if not expires:
+        return None
+    try:
+        expires = parsedate_to_datetime(expires)
+    except (TypeError, ValueError):
+        return None
+    if not settings.USE_TZ:
+        return timezone.make_naive(expires)
+    return expires
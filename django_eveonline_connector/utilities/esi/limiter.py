@@ -0,0 +1,112 @@
+from django.core.cache import cache
+from django_eveonline_connector.utilities.esi.etags import find_header
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class EsiErrorLimiter():
+    """
+    Keeps every worker inside the ESI error limit.
+    The remaining error budget and its reset time are read from the X-ESI-Error-Limit-* headers of each response
+    and shared through the Django cache. Below `slowdown` remaining errors, every worker draws its calls from one
+    shared counter per error window, and the nth call waits for its slot so all workers together make at most
+    the remaining budget of calls before the reset. At `pause` remaining errors or less, calls wait for the reset.
+    """
+    cache_key = "esi_error_limit"
+
+    def __init__(self, slowdown=50, pause=10):
+        self.slowdown = slowdown
+        self.pause = pause
+        self.throttled = 0
+        self.paused = 0
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def get_state(self):
+        """
+        Returns the last seen budget as a dict with `remain`, `reset_at` and `throttled_at` (epoch seconds), or None.
+        """
+        state = cache.get(self.cache_key)
+        if state and state['reset_at'] > time.time():
+            return state
+        return None
+
+    def get_call_number(self, state):
+        """
+        Returns the number of this call among the throttled calls of every worker in the error window of `state`.
+        """
+        key = f"{self.cache_key}_calls:{int(state['reset_at'])}"
+        timeout = max(1, int(state['reset_at'] - time.time()) + 1)
+        cache.add(key, 0, timeout=timeout)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # the counter expired between add and incr
+            cache.set(key, 1, timeout=timeout)
+            return 1
+
+    def wait(self):
+        state = self.get_state()
+        if not state or state['remain'] >= self.slowdown:
+            return
+        now = time.time()
+        delay = state['reset_at'] - now
+        if state['remain'] <= self.pause:
+            with self._lock:
+                self.paused += 1
+            logger.warning(
+                f"ESI error limit nearly exhausted, pausing for {delay:.1f} seconds")
+        else:
+            # spread the remaining budget over the rest of the window, counting the calls of every worker
+            throttled_at = state.get('throttled_at') or now
+            interval = (state['reset_at'] - throttled_at) / state['remain']
+            delay = min(throttled_at + self.get_call_number(state)
+                        * interval - now, delay)
+            with self._lock:
+                self.throttled += 1
+        with self._lock:
+            self.waited += max(delay, 0)
+        if delay > 0:
+            time.sleep(delay)
+
+    def update(self, headers):
+        remain = find_header(headers, 'X-ESI-Error-Limit-Remain')
+        reset = find_header(headers, 'X-ESI-Error-Limit-Reset')
+        if remain is None or reset is None:
+            return
+        try:
+            remain, reset = int(remain), int(reset)
+        except (TypeError, ValueError):
+            return
+        now = time.time()
+        reset_at = now + reset
+        throttled_at = None
+        state = cache.get(self.cache_key)
+        # responses of the same error window report the same reset, give or take a second
+        if state and abs(state['reset_at'] - reset_at) <= 2:
+            reset_at = state['reset_at']
+            throttled_at = state.get('throttled_at')
+        if remain < self.slowdown and not throttled_at:
+            throttled_at = now
+        cache.set(self.cache_key, {
+            'remain': remain,
+            'reset_at': reset_at,
+            'throttled_at': throttled_at,
+        }, timeout=reset + 1)
+        if remain < self.slowdown:
+            logger.warning(
+                f"ESI error limit: {remain} errors remaining, resets in {reset} seconds")
+
+    @property
+    def stats(self):
+        state = self.get_state()
+        return {
+            'remain': state['remain'] if state else None,
+            'reset_in': max(0, state['reset_at'] - time.time()) if state else None,
+            'throttled': self.throttled,
+            'paused': self.paused,
+            'waited': self.waited,
+        }
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+from django.apps import apps
+from django.db import transaction, DatabaseError
+from django.utils import timezone
+import datetime
+import threading
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# IDs per IN lookup, kept below SQLite's parameter limit
+LOOKUP_BATCH_SIZE = 500
+
+
+def chunks(ids):
+    ids = list(ids)
+    for index in range(0, len(ids), LOOKUP_BATCH_SIZE):
+        yield ids[index:index + LOOKUP_BATCH_SIZE]
+
+
+class NameCache():
+    """
+    Process-wide, bounded LRU of resolved universe names ({'name', 'type'} keyed by ID).
+    Entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, ids):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for external_id in ids:
+                entry = self._entries.get(external_id)
+                if entry and entry[1] > now:
+                    self._entries.move_to_end(external_id)
+                    found[external_id] = entry[0]
+                else:
+                    self._entries.pop(external_id, None)
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+
+    def set_many(self, resolved):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for external_id, value in resolved.items():
+                self._entries[external_id] = (value, expires_at)
+                self._entries.move_to_end(external_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    @property
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+app_config = apps.get_app_config('django_eveonline_connector')
+name_cache = NameCache(maxsize=app_config.ESI_NAME_CACHE_SIZE,
+                       ttl=app_config.ESI_NAME_CACHE_TTL)
+
+
+def get_known_names(ids):
+    """
+    Looks IDs up in the process cache, then in the EveName table, then in the EveEntity tables.
+    Returns {id: {'name', 'type'}} for every ID found; the process cache is warmed with the database hits.
+    """
+    from django_eveonline_connector.models import EveName, EveCharacter, EveCorporation, EveAlliance
+    ids = set(ids)
+    known = name_cache.get_many(ids)
+    misses = ids - set(known)
+    if not misses:
+        return known
+
+    found = {}
+    fresh_after = timezone.now() - datetime.timedelta(seconds=name_cache.ttl)
+    for chunk in chunks(misses):
+        for external_id, name, category in EveName.objects.filter(
+                external_id__in=chunk, updated__gte=fresh_after).values_list('external_id', 'name', 'category'):
+            found[external_id] = {'name': name, 'type': category}
+
+    for model, category in [(EveCharacter, 'character'), (EveCorporation, 'corporation'), (EveAlliance, 'alliance')]:
+        misses -= set(found)
+        for chunk in chunks(misses):
+            for external_id, name in model.objects.filter(external_id__in=chunk).values_list('external_id', 'name'):
+                found[external_id] = {'name': name, 'type': category}
+
+    name_cache.set_many(found)
+    known.update(found)
+    return known
+
+
+def store_names(resolved):
+    """
+    Writes names resolved by ESI to the process cache and the EveName table.
+    Existing rows are updated and new rows inserted ignoring conflicts, so workers storing the same IDs don't fail each other.
+    A failed database write is logged and never fails name resolution.
+    """
+    from django_eveonline_connector.models import EveName
+    if not resolved:
+        return
+    name_cache.set_many(resolved)
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            existing_names = []
+            for chunk in chunks(resolved.keys()):
+                for eve_name in EveName.objects.filter(external_id__in=chunk):
+                    value = resolved[eve_name.external_id]
+                    eve_name.name = value['name']
+                    eve_name.category = value['type']
+                    eve_name.updated = now
+                    existing_names.append(eve_name)
+            EveName.objects.bulk_update(
+                existing_names, ['name', 'category', 'updated'], batch_size=LOOKUP_BATCH_SIZE)
+
+            existing_ids = {eve_name.external_id for eve_name in existing_names}
+            EveName.objects.bulk_create([
+                EveName(external_id=external_id,
+                        name=value['name'], category=value['type'])
+                for external_id, value in resolved.items() if external_id not in existing_ids
+            ], batch_size=LOOKUP_BATCH_SIZE, ignore_conflicts=True)
+    except DatabaseError:
+        logger.exception(f"Failed to store {len(resolved)} resolved names")
+
+
+def get_name_cache_stats():
+    return name_cache.stats
@@ -0,0 +1,178 @@
+from django.apps import apps
+from django_eveonline_connector.models import EveClient
+from django_eveonline_connector.exceptions import EveServiceUnavailable
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def get_page_count(response):
+    if 'X-Pages' in response.header:
+        return int(response.header['X-Pages'][0])
+    return 1
+
+
+def get_pages(op, pages, max_workers=None, retries=None, conditional=False, **kwargs):
+    """
+    Fetches the requested pages of a paged ESI operation concurrently.
+    With conditional=True every page is sent with its own stored ETag, and a 304 response counts as fetched.
+    Failed pages are retried, and an EveServiceUnavailable is raised if any page still fails.
+
+    Returns a dict of page number to response.
+    """
+    app_config = apps.get_app_config('django_eveonline_connector')
+    if max_workers is None:
+        max_workers = app_config.ESI_PAGE_WORKERS
+    if retries is None:
+        retries = app_config.ESI_PAGE_RETRIES
+
+    results = {}
+    pending = list(pages)
+    for attempt in range(retries + 1):
+        if not pending:
+            break
+        if attempt:
+            logger.warning(
+                f"Retrying {len(pending)} failed page(s) of {op} (attempt {attempt}/{retries})")
+
+        responses = EveClient.call_many(
+            [(op, dict(kwargs, page=page, conditional=conditional)) for page in pending], max_workers=max_workers)
+        failed = []
+        for page, response in zip(pending, responses):
+            if isinstance(response, Exception):
+                logger.error(f"Failed to fetch page {page} of {op}: {response}")
+                failed.append(page)
+            elif response.status == 200 or (conditional and response.status == 304):
+                results[page] = response
+            else:
+                failed.append(page)
+        pending = failed
+
+    if pending:
+        raise EveServiceUnavailable(
+            f"Failed to fetch page(s) {pending} of {op} after {retries} retries")
+
+    return results
+
+
+def get_paged_data(op, response, **kwargs):
+    """
+    Takes the first page response of a paged ESI operation and returns the data of all pages, in page order.
+    Non-paged responses are returned as-is.
+    """
+    page_count = get_page_count(response)
+    if page_count <= 1:
+        return response.data
+
+    pages = range(2, page_count + 1)
+    results = get_pages(op, pages, **kwargs)
+
+    items = list(response.data)
+    for page in pages:
+        items += results[page].data
+    return items
+
+
+def get_conditional_paged_data(op, response, **kwargs):
+    """
+    Variant of get_paged_data for the first page response (200 or 304) of a conditional call.
+    ESI gives every page its own ETag, so when the first page is unchanged the other pages are sent conditionally too,
+    and the data only counts as unchanged when every page returned 304. Unchanged pages of changed data are fetched
+    again without If-None-Match.
+
+    Returns the data of all pages in page order (None if no page changed), and a dict of page number to response
+    whose ETags are saved with save_conditional_pages() once the data has been written.
+    """
+    page_count = get_page_count(response)
+    responses = {1: response}
+    if page_count > 1:
+        responses.update(get_pages(op, range(2, page_count + 1),
+                                   conditional=response.status == 304, **kwargs))
+
+    unchanged = [page for page, page_response in responses.items()
+                 if page_response.status == 304]
+    if len(unchanged) == len(responses):
+        return None, {}
+    if page_count <= 1:
+        return response.data, responses
+    if unchanged:
+        logger.info(
+            f"Fetching unchanged page(s) {unchanged} of {op} again, as other pages changed")
+        responses.update(get_pages(op, unchanged, **kwargs))
+
+    items = []
+    for page in range(1, page_count + 1):
+        items += responses[page].data
+    return items, responses
+
+
+def get_page_kwargs(page, kwargs):
+    # the first page is called without a page parameter
+    if page == 1:
+        return kwargs
+    return dict(kwargs, page=page)
+
+
+def save_conditional_pages(op, responses, **kwargs):
+    """
+    Saves the ETag of every fetched page, once the data of the pages has been written.
+    """
+    for page, response in (responses or {}).items():
+        EveClient.save_conditional(
+            op, response, **get_page_kwargs(page, kwargs))
+
+
+def discard_conditional_pages(op, responses, **kwargs):
+    """
+    Forgets the stored ETags of the pages of a dataset that could not be written, so the next call fetches it again.
+    """
+    for page in set(responses or {}) | {1}:
+        EveClient.discard_conditional(op, **get_page_kwargs(page, kwargs))
+
+
+def get_paged_data_until(op, response, reached, max_workers=None, **kwargs):
+    """
+    Variant of get_paged_data for paged ESI operations that return the newest rows first.
+    Pages are fetched in windows of `max_workers`, and paging stops at the first page holding a row for which `reached(row)` is true.
+    """
+    items = list(response.data)
+    if any(reached(row) for row in response.data):
+        return items
+
+    if max_workers is None:
+        max_workers = apps.get_app_config(
+            'django_eveonline_connector').ESI_PAGE_WORKERS
+    page_count = get_page_count(response)
+    next_page = 2
+    while next_page <= page_count:
+        pages = range(next_page, min(next_page + max_workers, page_count + 1))
+        results = get_pages(op, pages, max_workers=max_workers, **kwargs)
+        for page in pages:
+            items += results[page].data
+            if any(reached(row) for row in results[page].data):
+                logger.info(
+                    f"Stopped paging {op} at page {page} of {page_count}")
+                return items
+        next_page = pages[-1] + 1
+    return items
+
+
+def get_from_id_data(op, response, key, reached, **kwargs):
+    """
+    Variant of get_paged_data for ESI operations that page with `from_id` and return the newest rows first.
+    Older batches are requested from the oldest `key` seen (ESI returns the rows before it), until a batch holds
+    a row for which `reached(row)` is true or ESI has nothing older. Rows are de-duplicated by `key`.
+    """
+    items = list(response.data)
+    seen = {row[key] for row in items}
+    rows = response.data
+    while rows and not any(reached(row) for row in rows):
+        from_id = min(row[key] for row in rows)
+        response = EveClient.call(op, from_id=from_id, **kwargs)
+        if response.status != 200:
+            raise EveServiceUnavailable(
+                f"Failed to fetch {op} from_id {from_id}: {response.status}")
+        rows = [row for row in response.data if row[key] not in seen]
+        seen.update(row[key] for row in rows)
+        items += rows
+    return items
@@ -0,0 +1,72 @@
+from contextlib import contextmanager
+import threading
+import logging
+import queue
+import os
+
+logger = logging.getLogger(__name__)
+
+
+class EsiClientPool():
+    """
+    Per-process pool of keep-alive EsiClient objects.
+    Clients are created lazily by `factory` and returned to the pool after each request,
+    so the underlying HTTP session (and its TLS connections) is reused between ESI calls.
+    """
+
+    def __init__(self, factory, size=10):
+        self.factory = factory
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._clients = queue.LifoQueue(maxsize=self.size)
+
+    def acquire(self):
+        # sessions must never be shared with a forked worker process
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._reset()
+        try:
+            client = self._clients.get_nowait()
+            with self._lock:
+                self.hits += 1
+        except queue.Empty:
+            client = self.factory()
+            with self._lock:
+                self.misses += 1
+        return client
+
+    def release(self, client):
+        if self._pid != os.getpid():
+            return
+        try:
+            self._clients.put_nowait(client)
+        except queue.Full:
+            logger.debug("EsiClient pool is full, discarding client")
+
+    @contextmanager
+    def client(self):
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    @property
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': self._clients.qsize(),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,54 @@
+from django.apps import apps
+from django.core.cache import cache
+from django.utils import timezone
+import datetime
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+
+def get_schedule_key(op, entity_id):
+    return f"esi_next_run:{op}:{entity_id}"
+
+
+def schedule_next_run(op, entity_id, expires):
+    """
+    Records that `op` should not be called again for `entity_id` before `expires`, plus a random jitter
+    of up to ESI_EXPIRES_JITTER seconds so entities cached together are not requeued together.
+    """
+    if not expires:
+        return
+    jitter = apps.get_app_config(
+        'django_eveonline_connector').ESI_EXPIRES_JITTER
+    next_run = expires + datetime.timedelta(seconds=random.uniform(0, jitter))
+    timeout = (next_run - timezone.now()).total_seconds()
+    if timeout <= 0:
+        return
+    cache.set(get_schedule_key(op, entity_id), next_run, timeout=timeout)
+
+
+def get_next_run(op, entity_id):
+    return cache.get(get_schedule_key(op, entity_id))
+
+
+def is_due(op, entity_id):
+    next_run = get_next_run(op, entity_id)
+    return next_run is None or next_run <= timezone.now()
+
+
+def get_due_entity_ids(ops, entity_ids):
+    """
+    Returns the entity IDs that have at least one of `ops` due, in a single cache lookup.
+    """
+    entity_ids = list(entity_ids)
+    keys = {get_schedule_key(op, entity_id): entity_id
+            for op in ops for entity_id in entity_ids}
+    scheduled = cache.get_many(keys.keys())
+    now = timezone.now()
+
+    due_entity_ids = set()
+    for key, entity_id in keys.items():
+        if key not in scheduled or scheduled[key] <= now:
+            due_entity_ids.add(entity_id)
+    return [entity_id for entity_id in entity_ids if entity_id in due_entity_ids]
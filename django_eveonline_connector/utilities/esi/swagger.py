@@ -0,0 +1,245 @@
+from django.apps import apps
+from pyswagger import App
+from pyswagger.getter import DictGetter
+import requests
+import tempfile
+import threading
+import logging
+import stat
+import json
+import time
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+ESI_SWAGGER_URL = "https://esi.evetech.net/latest/swagger.json?datasource=tranquility"
+
+# Seconds between checks of the snapshot directory for a newer swagger version
+SNAPSHOT_CHECK_INTERVAL = 300
+
+esi_app_state = {
+    'app': None,
+    'version': None,
+    'source': None,
+    'load_time': None,
+    'checked_at': None,
+    'refreshing': False,
+}
+esi_app_lock = threading.Lock()
+
+
+def get_snapshot_dir():
+    snapshot_dir = apps.get_app_config(
+        'django_eveonline_connector').ESI_SWAGGER_DIR
+    if not snapshot_dir:
+        # one directory per user, as the temporary directory is shared with every local user
+        user = os.getuid() if hasattr(os, 'getuid') else 'default'
+        snapshot_dir = os.path.join(
+            tempfile.gettempdir(), f"django_eveonline_connector-{user}")
+    return snapshot_dir
+
+
+def is_trusted_path(path):
+    """
+    True when `path` is not a symlink, is owned by the current user and can't be written by other users.
+    The swagger `host` decides where tokens are sent, so snapshots anyone else could have planted are never loaded.
+    """
+    try:
+        path_stat = os.lstat(path)
+    except OSError:
+        return False
+    if stat.S_ISLNK(path_stat.st_mode):
+        return False
+    if hasattr(os, 'getuid') and path_stat.st_uid != os.getuid():
+        return False
+    return not path_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def is_trusted_snapshot_file(path):
+    if not is_trusted_path(get_snapshot_dir()) or not is_trusted_path(path):
+        logger.error(
+            f"Refusing to load ESI swagger snapshot {path}: it or its directory is not owned by this user or is writable by others")
+        return False
+    return True
+
+
+def make_snapshot_dir():
+    snapshot_dir = get_snapshot_dir()
+    os.makedirs(snapshot_dir, mode=0o700, exist_ok=True)
+    if not is_trusted_path(snapshot_dir):
+        raise OSError(
+            f"ESI swagger snapshot directory {snapshot_dir} is not owned by this user or is writable by others")
+
+
+def get_snapshot_path(version):
+    version = re.sub(r'[^\w.-]', '_', version)
+    return os.path.join(get_snapshot_dir(), f"esi-swagger-{version}.json")
+
+
+def get_pointer_path():
+    return os.path.join(get_snapshot_dir(), "esi-swagger.current")
+
+
+def write_file(path, content):
+    # write then rename, so readers never see a partial file
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), 'w') as f:
+        f.write(content)
+    os.replace(temp_path, path)
+
+
+def write_snapshot(spec):
+    """
+    Saves a swagger definition as a versioned snapshot and marks it as current.
+    Returns the swagger version.
+    """
+    version = spec['info']['version']
+    make_snapshot_dir()
+    write_file(get_snapshot_path(version), json.dumps(spec))
+    write_file(get_pointer_path(), version)
+    return version
+
+
+def get_snapshot_version():
+    if not os.path.exists(get_pointer_path()) or not is_trusted_snapshot_file(get_pointer_path()):
+        return None
+    try:
+        with open(get_pointer_path()) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def get_snapshot_age():
+    try:
+        return time.time() - os.path.getmtime(get_pointer_path())
+    except OSError:
+        return None
+
+
+def read_snapshot(version):
+    if not is_trusted_snapshot_file(get_snapshot_path(version)):
+        return None
+    try:
+        with open(get_snapshot_path(version)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logger.exception(f"Failed to read ESI swagger snapshot {version}")
+        return None
+
+
+def download_swagger():
+    response = requests.get(ESI_SWAGGER_URL, timeout=60, headers={
+        'Accept': "application/json", 'User-Agent': "Krypted Platform"})
+    response.raise_for_status()
+    return response.json()
+
+
+def refresh_snapshot():
+    """
+    Downloads the latest swagger definition and writes it as the current snapshot.
+    Processes pick it up on their next snapshot check.
+    """
+    version = write_snapshot(download_swagger())
+    logger.info(f"Saved ESI swagger snapshot {version}")
+    return version
+
+
+def refresh_snapshot_in_background():
+    with esi_app_lock:
+        if esi_app_state['refreshing']:
+            return
+        esi_app_state['refreshing'] = True
+
+    def refresh():
+        try:
+            refresh_snapshot()
+        except Exception:
+            logger.exception("Failed to refresh ESI swagger snapshot")
+        finally:
+            esi_app_state['refreshing'] = False
+
+    threading.Thread(target=refresh, daemon=True).start()
+
+
+def build_esi_app(spec):
+    # the snapshot is served under the ESI URL, so the app resolves exactly as if it were downloaded
+    esi_app = App.load(ESI_SWAGGER_URL, getter=DictGetter(
+        [ESI_SWAGGER_URL], {ESI_SWAGGER_URL: spec}))
+    esi_app.prepare()
+    return esi_app
+
+
+def load_esi_app():
+    """
+    Returns the parsed swagger app of this process.
+    The app is parsed once from the current on-disk snapshot, and only reparsed when a newer snapshot is written.
+    ESI is only downloaded on the request path when no snapshot exists yet; stale snapshots are refreshed
+    in a background thread (or by the refresh_esi_swagger task).
+    """
+    now = time.monotonic()
+    if esi_app_state['app'] and now - esi_app_state['checked_at'] < SNAPSHOT_CHECK_INTERVAL:
+        return esi_app_state['app']
+
+    with esi_app_lock:
+        if esi_app_state['app'] and now - esi_app_state['checked_at'] < SNAPSHOT_CHECK_INTERVAL:
+            return esi_app_state['app']
+        esi_app_state['checked_at'] = now
+
+        version = get_snapshot_version()
+        if esi_app_state['app'] and (not version or version == esi_app_state['version']):
+            esi_app = esi_app_state['app']
+        else:
+            spec = read_snapshot(version) if version else None
+            source = "snapshot"
+            if spec is None and esi_app_state['app']:
+                esi_app = esi_app_state['app']
+            else:
+                if spec is None:
+                    spec = download_swagger()
+                    source = "network"
+                    try:
+                        write_snapshot(spec)
+                    except OSError:
+                        logger.exception(
+                            "Failed to write ESI swagger snapshot")
+
+                start = time.monotonic()
+                esi_app = build_esi_app(spec)
+                esi_app_state.update({
+                    'app': esi_app,
+                    'version': spec['info']['version'],
+                    'source': source,
+                    'load_time': time.monotonic() - start,
+                })
+                logger.info(
+                    f"Loaded ESI swagger {esi_app_state['version']} from {source} in {esi_app_state['load_time']:.2f} seconds")
+
+    max_age = apps.get_app_config(
+        'django_eveonline_connector').ESI_SWAGGER_MAX_AGE
+    age = get_snapshot_age()
+    if max_age and age is not None and age > max_age:
+        refresh_snapshot_in_background()
+
+    return esi_app
+
+
+def clear_esi_app():
+    with esi_app_lock:
+        esi_app_state.update({
+            'app': None,
+            'version': None,
+            'source': None,
+            'load_time': None,
+            'checked_at': None,
+        })
+
+
+def get_esi_app_stats():
+    return {
+        'version': esi_app_state['version'],
+        'source': esi_app_state['source'],
+        'load_time': esi_app_state['load_time'],
+        'snapshot_age': get_snapshot_age(),
+    }
@@ -0,0 +1,46 @@
+from django.apps import apps
+from django_eveonline_connector.exceptions import EveTokenRefreshTimeout
+from django_eveonline_connector.utilities.threads import map_concurrently, RateLimiter
+import logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_REFRESHED = 'refreshed'
+TOKEN_NOT_EXPIRED = 'skipped'
+TOKEN_INVALID_GRANT = 'invalid_grant'
+TOKEN_LOCK_TIMEOUT = 'lock_timeout'
+TOKEN_ERROR = 'error'
+
+
+def refresh_tokens(tokens, max_workers=None, rate=None):
+    """
+    Refreshes many EveTokens concurrently, at most `rate` SSO requests per second.
+    Tokens that are not close to expiry are skipped without a network call.
+
+    Returns a dict of token pk to outcome.
+    """
+    app_config = apps.get_app_config('django_eveonline_connector')
+    if max_workers is None:
+        max_workers = app_config.SSO_REFRESH_WORKERS
+    if rate is None:
+        rate = app_config.SSO_REFRESH_RATE
+    rate_limiter = RateLimiter(rate)
+
+    def refresh_token(token):
+        if not token.needs_refresh:
+            return TOKEN_NOT_EXPIRED
+        rate_limiter.wait()
+        try:
+            if token.refresh(raise_on_timeout=True):
+                return TOKEN_REFRESHED
+            return TOKEN_INVALID_GRANT
+        except EveTokenRefreshTimeout:
+            # another worker is still refreshing it, the token itself may well be valid
+            return TOKEN_LOCK_TIMEOUT
+        except Exception:
+            logger.exception(f"Failed to refresh token {token.pk}")
+            return TOKEN_ERROR
+
+    tokens = list(tokens)
+    outcomes = map_concurrently(refresh_token, tokens, max_workers=max_workers)
+    return {token.pk: outcome for token, outcome in zip(tokens, outcomes)}
@@ -1,5 +1,8 @@
 from django_eveonline_connector.models import EveClient, EveToken
 from django_eveonline_connector.exceptions import EveDataResolutionError
+from django_eveonline_connector.utilities.threads import map_concurrently
+from django_eveonline_connector.utilities.esi.names import get_known_names, store_names
+from django_eveonline_connector.utilities.esi.etags import get_expires
 from django.core.cache import cache
 import logging
 
@@ -17,20 +20,7 @@ def resolve_id(id):
 
 
 def resolve_ids(ids):
-    response = EveClient.call('post_universe_names', ids=ids)
-
-    if response.status != 200:
-        raise EveDataResolutionError(
-            f"[{response.status} Failed to resolve universe names. {response.data}")
-
-    resolved_ids = response.data
-    response = {}
-    for resolved_id in resolved_ids:
-        external_id = resolved_id['id']
-        external_name = resolved_id['name']
-        if external_id not in response:
-            response[external_id] = external_name
-    return response
+    return {external_id: resolved['name'] for external_id, resolved in resolve_ids_with_types(ids).items()}
 
 
 def resolve_names(names):
@@ -39,9 +29,21 @@ def resolve_names(names):
 
 
 def resolve_ids_with_types(ids):
+    """
+    Resolves IDs to {'name', 'type'}, using the name cache, the EveName table and EveEntity rows before ESI.
+    Only unknown IDs are sent to ESI, and their names are written back to the cache.
+    """
+    ids = {int(external_id) for external_id in ids if external_id is not None}
+    known = get_known_names(ids)
     response = {}
-    for ids_segment in batch(list(ids), 999):
-        request = EveClient.call('post_universe_names', ids=ids_segment)
+    ids_segments = list(
+        batch([external_id for external_id in ids if external_id not in known], 999))
+    requests = EveClient.call_many(
+        [('post_universe_names', {'ids': ids_segment}) for ids_segment in ids_segments])
+    for ids_segment, request in zip(ids_segments, requests):
+        if isinstance(request, Exception):
+            raise EveDataResolutionError(
+                f"Failed to resolve IDs: {ids_segment}\nReason: {request}")
         if request.status != 200:
             raise EveDataResolutionError(
                 f"[{request.status}] Failed to resolve IDs: {ids_segment}\nResponse: {request.data}")
@@ -56,9 +58,44 @@ def resolve_ids_with_types(ids):
                     "name": external_name,
                     "type": external_type
                 }
+    store_names(response)
+    response.update(known)
     return response
 
 
+def get_affiliations(character_ids):
+    """
+    Resolves character affiliations, sending every 1000 character chunk concurrently.
+    Chunks that fail are logged and left out of the result.
+
+    Returns the affiliations, and the earliest Expires of the chunks that succeeded (None if none did).
+    """
+    def get_chunk(character_ids_segment):
+        try:
+            response = EveClient.call(
+                'post_characters_affiliation', characters=character_ids_segment)
+        except Exception:
+            logger.exception(
+                f"Failed to resolve affiliations for {len(character_ids_segment)} characters")
+            return None
+        if response.status != 200:
+            logger.error(
+                f"[{response.status}] Failed to resolve affiliations for {len(character_ids_segment)} characters: {response.data}")
+            return None
+        return response
+
+    affiliations = []
+    expires = None
+    for response in map_concurrently(get_chunk, batch(list(character_ids), 1000)):
+        if not response:
+            continue
+        affiliations += response.data
+        response_expires = get_expires(response)
+        if response_expires and (not expires or response_expires < expires):
+            expires = response_expires
+    return affiliations, expires
+
+
 def get_type_id(type_id):
     response = EveClient.call(
         'get_universe_types_type_id', type_id=type_id, raise_exception=True)
@@ -72,6 +109,10 @@ def get_station_id(station_id):
     return EveClient.call('get_universe_stations_station_id', station_id=station_id).data
 
 
+def get_system_id(system_id):
+    return EveClient.call('get_universe_systems_system_id', system_id=system_id).data
+
+
 def get_group_id(group_id):
     return EveClient.call('get_universe_groups_group_id', group_id=group_id).data
 
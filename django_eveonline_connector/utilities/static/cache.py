@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from functools import wraps
+from django.apps import apps
+from django_eveonline_connector.utilities.static.tables import static_type_table
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class StaticResolverCache():
+    """
+    Process-wide, bounded LRU memo for static data resolvers.
+    Entries are only valid for the SDE version they were resolved against.
+    """
+
+    def __init__(self, maxsize, sde_version):
+        self.maxsize = maxsize
+        self.sde_version = sde_version
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                raise
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, sde_version=None):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            if sde_version is not None:
+                self.sde_version = sde_version
+
+    @property
+    def stats(self):
+        return {
+            'sde_version': self.sde_version,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+app_config = apps.get_app_config('django_eveonline_connector')
+static_resolver_cache = StaticResolverCache(
+    maxsize=app_config.EVE_STATIC_CACHE_SIZE,
+    sde_version=app_config.EVE_STATIC_VERSION)
+
+
+def memoize_static(func):
+    """
+    Memoizes a static resolver in static_resolver_cache.
+    Results are keyed by SDE version, resolver and arguments. Unresolved (None) results are not stored.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        arguments = tuple(sorted(
+            (key, value) for key, value in kwargs.items() if key != 'raise_exception'))
+        key = (static_resolver_cache.sde_version,
+               func.__name__, args, arguments)
+        try:
+            return static_resolver_cache.get(key)
+        except KeyError:
+            pass
+        value = func(*args, **kwargs)
+        if value is not None:
+            static_resolver_cache.set(key, value)
+        return value
+    return wrapper
+
+
+def get_memoized(resolver_name, *args):
+    """
+    Returns the memoized result of a static resolver call, or None.
+    Used by batch resolvers to share results with the single ID resolvers.
+    """
+    try:
+        return static_resolver_cache.get((static_resolver_cache.sde_version, resolver_name, args, ()))
+    except KeyError:
+        return None
+
+
+def set_memoized(resolver_name, value, *args):
+    if value is not None:
+        static_resolver_cache.set(
+            (static_resolver_cache.sde_version, resolver_name, args, ()), value)
+
+
+def invalidate_static_cache(sde_version=None):
+    """
+    Clears every memoized static resolution and the preloaded type table. 
+    Call this after upgrading the static database, optionally passing the new SDE version.
+    """
+    logger.info(
+        f"Invalidating static resolver cache (SDE version: {sde_version or static_resolver_cache.sde_version})")
+    static_resolver_cache.invalidate(sde_version)
+    static_type_table.clear()
+
+
+def get_static_cache_stats():
+    return static_resolver_cache.stats
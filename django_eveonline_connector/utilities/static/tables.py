@@ -0,0 +1,130 @@
+from array import array
+from bisect import bisect_left
+from django.apps import apps
+from django.db import connections
+import django.db.utils
+import threading
+import logging
+import sys
+
+logger = logging.getLogger(__name__)
+
+
+class StaticLookupTable():
+    """
+    Compact, read-only lookup table built from static database rows.
+    Keys are kept in a sorted integer array, integer columns in parallel arrays and text columns in parallel lists.
+    """
+
+    def __init__(self, rows, int_columns=(), text_columns=()):
+        rows = sorted(rows, key=lambda row: row[0])
+        self.keys = array('q', (row[0] for row in rows))
+        self.columns = {}
+        for index, column in enumerate(int_columns, start=1):
+            self.columns[column] = array(
+                'q', (row[index] or 0 for row in rows))
+        for index, column in enumerate(text_columns, start=len(int_columns) + 1):
+            self.columns[column] = [row[index] for row in rows]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def get(self, key, column):
+        try:
+            key = int(key)
+        except (TypeError, ValueError):
+            return None
+        index = bisect_left(self.keys, key)
+        if index < len(self.keys) and self.keys[index] == key:
+            return self.columns[column][index]
+        return None
+
+    @property
+    def memory_footprint(self):
+        size = sys.getsizeof(self.keys)
+        for values in self.columns.values():
+            size += sys.getsizeof(values)
+            if isinstance(values, list):
+                size += sum(sys.getsizeof(value) for value in values)
+        return size
+
+
+class StaticTypeTable():
+    """
+    In-memory copy of invTypes, invGroups and invCategories, loaded lazily in three queries.
+    Lookups return None when preloading is disabled, failed, or the ID is unknown.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.loaded = False
+        self.failed = False
+        self.types = None
+        self.groups = None
+        self.categories = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            if self.loaded or self.failed:
+                return
+            try:
+                with connections['eve_static'].cursor() as cursor:
+                    cursor.execute(
+                        "select typeID, groupID, typeName from invTypes")
+                    types = StaticLookupTable(cursor.fetchall(), int_columns=[
+                                              'group_id'], text_columns=['name'])
+                    cursor.execute(
+                        "select groupID, categoryID, groupName from invGroups")
+                    groups = StaticLookupTable(cursor.fetchall(), int_columns=[
+                                               'category_id'], text_columns=['name'])
+                    cursor.execute(
+                        "select categoryID, categoryName from invCategories")
+                    categories = StaticLookupTable(
+                        cursor.fetchall(), text_columns=['name'])
+            except (django.db.utils.DatabaseError, django.db.utils.ConnectionDoesNotExist) as e:
+                logger.error(
+                    f"Failed to preload EVE Static Database type tables, falling back to queries. {e}")
+                self.failed = True
+                return
+
+            self.types, self.groups, self.categories = types, groups, categories
+            self.loaded = True
+            logger.info(
+                f"Preloaded {len(types)} types, {len(groups)} groups and {len(categories)} categories ({self.memory_footprint} bytes)")
+
+    def lookup(self, table, key, column):
+        if not self.enabled:
+            return None
+        if not self.loaded:
+            self.load()
+            if not self.loaded:
+                return None
+        return getattr(self, table).get(key, column)
+
+    def clear(self):
+        with self._lock:
+            self.loaded = False
+            self.failed = False
+            self.types = self.groups = self.categories = None
+
+    @property
+    def memory_footprint(self):
+        if not self.loaded:
+            return 0
+        return sum(table.memory_footprint for table in [self.types, self.groups, self.categories])
+
+
+app_config = apps.get_app_config('django_eveonline_connector')
+static_type_table = StaticTypeTable(enabled=app_config.EVE_STATIC_PRELOAD)
+
+
+def get_static_type_table_stats():
+    return {
+        'enabled': static_type_table.enabled,
+        'loaded': static_type_table.loaded,
+        'types': len(static_type_table.types) if static_type_table.loaded else 0,
+        'groups': len(static_type_table.groups) if static_type_table.loaded else 0,
+        'categories': len(static_type_table.categories) if static_type_table.loaded else 0,
+        'memory_footprint': static_type_table.memory_footprint,
+    }
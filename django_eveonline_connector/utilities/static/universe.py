@@ -1,6 +1,9 @@
 from django.db import connections
 from django_eveonline_connector.utilities.esi.universe import *
 from django_eveonline_connector.exceptions import EveDataResolutionError
+from django_eveonline_connector.utilities.static.cache import memoize_static, get_memoized, set_memoized
+from django_eveonline_connector.utilities.static.tables import static_type_table
+from django_eveonline_connector.utilities.threads import map_concurrently
 from django.db.utils import ConnectionDoesNotExist, OperationalError
 import django.db.utils
 import logging
@@ -32,12 +35,17 @@ def query_static_database(query, raise_exception=False, fetchall=False):
         
     return None 
 
+@memoize_static
 def resolve_type_id_to_type_name(type_id, raise_exception=True):
     """
     Resolves an EVE Online type_id to type_name. Falls back to ESI if not found in static database.
 
     Returns None if not found.
     """
+    type_name = static_type_table.lookup('types', type_id, 'name')
+    if type_name:
+        return type_name
+
     query = "select typeName from invTypes where typeID = %s" % type_id
     type_name = query_static_database(query)
     
@@ -53,6 +61,7 @@ def resolve_type_id_to_type_name(type_id, raise_exception=True):
 
     return type_name['name']
 
+@memoize_static
 def resolve_type_name_to_type_id(type_name, raise_exception=True):
     """
     Resolve type_name to type_id.
@@ -75,7 +84,12 @@ def resolve_type_name_to_type_id(type_name, raise_exception=True):
 
     return type_id 
 
+@memoize_static
 def resolve_type_id_to_group_id(type_id, raise_exception=True):
+    group_id = static_type_table.lookup('types', type_id, 'group_id')
+    if group_id:
+        return group_id
+
     query = "select groupID from invTypes where typeID = %s" % type_id
     group_id = query_static_database(query)
     
@@ -95,6 +109,7 @@ def resolve_type_id_to_group_id(type_id, raise_exception=True):
     return group_id 
 
 
+@memoize_static
 def resolve_type_id_to_category_name(type_id, raise_exception=True):
     category_id = resolve_type_id_to_category_id(type_id)
     category_name = resolve_category_id_to_category_name(category_id)
@@ -103,7 +118,12 @@ def resolve_type_id_to_category_name(type_id, raise_exception=True):
             f"Failed to resolve type_id({type_id}) to category name")
     return category_name
 
+@memoize_static
 def resolve_group_id_to_group_name(group_id, raise_exception=True):
+    group_name = static_type_table.lookup('groups', group_id, 'name')
+    if group_name:
+        return group_name
+
     query = "select groupName from invGroups where groupID = %s" % group_id
     group_name = query_static_database(query)
 
@@ -122,12 +142,18 @@ def resolve_group_id_to_group_name(group_id, raise_exception=True):
     return group_name 
 
 
+@memoize_static
 def resolve_type_id_to_group_name(type_id):
     group_id = resolve_type_id_to_group_id(type_id)
     return resolve_group_id_to_group_name(group_id)
 
 
+@memoize_static
 def resolve_group_id_to_category_id(group_id, raise_exception=True):
+    category_id = static_type_table.lookup('groups', group_id, 'category_id')
+    if category_id:
+        return category_id
+
     query = "select categoryID from invGroups where groupID = %s" % group_id
     category_id = query_static_database(query)
 
@@ -146,7 +172,13 @@ def resolve_group_id_to_category_id(group_id, raise_exception=True):
     
     return category_id
 
+@memoize_static
 def resolve_category_id_to_category_name(category_id, raise_exception=True):
+    category_name = static_type_table.lookup(
+        'categories', category_id, 'name')
+    if category_name:
+        return category_name
+
     query = "select categoryName from invCategories where categoryID = %s" % category_id
     category_name = query_static_database(query)
 
@@ -165,12 +197,98 @@ def resolve_category_id_to_category_name(category_id, raise_exception=True):
 
     return category_name
 
+@memoize_static
 def resolve_type_id_to_category_id(type_id):
     group_id = resolve_type_id_to_group_id(type_id)
     category_id = resolve_group_id_to_category_id(group_id)
     return int(category_id)
 
 
+def resolve_type_ids(type_ids):
+    """
+    Batch variant of the resolve_type_id_to_??? resolvers.
+    Resolves many type_ids with chunked IN queries joining invTypes, invGroups and invCategories.
+    Type IDs missing from the static database are resolved concurrently using ESI.
+
+    Returns a dict of type_id to {name, group_id, group_name, category_id, category_name}.
+    Type IDs that could not be resolved are omitted.
+    """
+    resolved = {}
+    missing = set()
+    for type_id in set(type_ids):
+        if type_id is None:
+            continue
+        type_id = int(type_id)
+        cached = get_memoized('resolve_type_ids', type_id)
+        if cached:
+            resolved[type_id] = cached
+        elif static_type_table.lookup('types', type_id, 'name'):
+            group_id = static_type_table.lookup('types', type_id, 'group_id')
+            category_id = static_type_table.lookup(
+                'groups', group_id, 'category_id')
+            resolved[type_id] = {
+                'name': static_type_table.lookup('types', type_id, 'name'),
+                'group_id': group_id,
+                'group_name': static_type_table.lookup('groups', group_id, 'name'),
+                'category_id': category_id,
+                'category_name': static_type_table.lookup('categories', category_id, 'name'),
+            }
+        else:
+            missing.add(type_id)
+
+    for type_ids_segment in batch(sorted(missing), 500):
+        query = """SELECT t.typeID, t.typeName, g.groupID, g.groupName, c.categoryID, c.categoryName
+            FROM invTypes t
+            JOIN invGroups g ON g.groupID = t.groupID
+            JOIN invCategories c ON c.categoryID = g.categoryID
+            WHERE t.typeID IN (%s)""" % ",".join(str(type_id) for type_id in type_ids_segment)
+        for row in query_static_database(query, fetchall=True) or []:
+            resolved[row[0]] = {
+                'name': row[1],
+                'group_id': row[2],
+                'group_name': row[3],
+                'category_id': row[4],
+                'category_name': row[5],
+            }
+
+    missing = missing - set(resolved)
+    if missing:
+        logger.info("Resolving %s type_ids using ESI" % len(missing))
+        resolved.update(resolve_type_ids_using_esi(missing))
+
+    for type_id, type_data in resolved.items():
+        set_memoized('resolve_type_ids', type_data, type_id)
+        set_memoized('resolve_type_id_to_type_name', type_data['name'], type_id)
+        set_memoized('resolve_type_id_to_group_id', type_data['group_id'], type_id)
+
+    return resolved
+
+
+def resolve_type_ids_using_esi(type_ids):
+    def resolve(type_id):
+        try:
+            response = get_type_id(type_id)
+            group_id = response['group_id']
+            category_id = resolve_group_id_to_category_id(group_id)
+            return type_id, {
+                'name': response['name'],
+                'group_id': group_id,
+                'group_name': resolve_group_id_to_group_name(group_id),
+                'category_id': int(category_id),
+                'category_name': resolve_category_id_to_category_name(category_id),
+            }
+        except Exception:
+            logger.exception(f"Failed to resolve type_id ({type_id}) using ESI")
+            return type_id, None
+
+    resolved = {}
+    for type_id, type_data in map_concurrently(resolve, type_ids):
+        if type_data:
+            resolved[type_id] = type_data
+    return resolved
+
+
+@memoize_static
 def resolve_location_id_to_station(location_id, raise_exception=True):
     if location_id < 60000000 or location_id > 64000000:
         raise EveDataResolutionError('Attempted to resolve a station outside of the possible range')
@@ -211,21 +329,114 @@ def resolve_location_id(location_id, token_entity_id):
     return "Unknown Location"
     
 def resolve_location_from_location_id_location_type(location_id, location_type, token_entity_id):
-    location = f"Unknown Location ({location_id})"
+    """
+    Single location variant of resolve_locations.
+    Raises EveDataResolutionError if the location could not be resolved.
+    """
     logger.debug("Resolving location_id (%s) of location_type(%s) to location_name" %
         (location_id, location_type))
-    try:
-        if location_type == 'station':
-            location = resolve_location_id_to_station(location_id)
-        else:
-            location = get_structure_id(location_id, token_entity_id)
-            
-    except Exception as e:
+    location = resolve_locations(
+        [(location_id, location_type)], token_entity_id).get(location_id)
+    if not location:
         raise EveDataResolutionError(
-            f"Failed to resolve location_id ({location_id}) of location_type ({location_type}). Reason: {str(e)}")
-
+            f"Failed to resolve location_id ({location_id}) of location_type ({location_type})")
     return location
 
+# Fixed location ID ranges, see https://developers.eveonline.com/docs/guides/id-ranges/
+ASSET_SAFETY_LOCATION_ID = 2004
+SOLAR_SYSTEM_ID_RANGE = range(30000000, 33000000)
+STATION_ID_RANGE = range(60000000, 64000001)
+
+def get_location_category(location_id, location_type=None):
+    """
+    Returns how a location is resolved: 'asset_safety', 'solar_system', 'station' or 'structure'.
+    The ID range decides, as ESI reports most locations outside of stations as 'other' or 'item'.
+    """
+    if location_id == ASSET_SAFETY_LOCATION_ID:
+        return 'asset_safety'
+    if location_id in SOLAR_SYSTEM_ID_RANGE or location_type == 'solar_system':
+        return 'solar_system'
+    if location_id in STATION_ID_RANGE:
+        return 'station'
+    return 'structure'
+
+def resolve_locations(locations, token_entity_id):
+    """
+    Batch location resolver, for a set of (location_id, location_type) pairs.
+    Locations are looked up in the shared Django cache first. Stations and solar systems are then resolved with
+    one static query each, and structures with one EveStructure query. Stations and solar systems missing from
+    the static database are resolved concurrently using ESI. Structures are never resolved using ESI,
+    as structure resolution can lead to ESI lockouts.
+
+    Returns a dict of location_id to location name. Locations that could not be resolved are omitted.
+    """
+    from django_eveonline_connector.models import EveStructure
+    categories = {}
+    for location_id, location_type in locations:
+        if location_id is not None:
+            categories[int(location_id)] = get_location_category(
+                int(location_id), location_type)
+    if not categories:
+        return {}
+
+    resolved = {}
+    for key, name in cache.get_many([str(location_id) for location_id in categories]).items():
+        if name:
+            resolved[int(key)] = name
+    pending = {location_id: category for location_id, category in categories.items()
+               if location_id not in resolved}
+
+    found = {}
+    static_queries = {
+        'station': "SELECT stationID, stationName FROM staStations WHERE stationID IN (%s)",
+        'solar_system': "SELECT solarSystemID, solarSystemName FROM mapSolarSystems WHERE solarSystemID IN (%s)",
+    }
+    for category, query in static_queries.items():
+        location_ids = sorted(location_id for location_id, location_category in pending.items()
+                              if location_category == category)
+        for location_ids_segment in batch(location_ids, 500):
+            rows = query_static_database(
+                query % ",".join(str(location_id) for location_id in location_ids_segment), fetchall=True)
+            for location_id, name in rows or []:
+                found[location_id] = name
+
+    structure_ids = sorted(location_id for location_id, category in pending.items()
+                           if category == 'structure')
+    for structure_ids_segment in batch(structure_ids, 500):
+        for structure_id, name in EveStructure.objects.filter(
+                structure_id__in=structure_ids_segment).values_list('structure_id', 'name'):
+            resolved[structure_id] = name
+
+    def resolve_using_esi(location_id):
+        try:
+            if pending[location_id] == 'station':
+                return location_id, get_station_id(location_id).get('name')
+            return location_id, get_system_id(location_id).get('name')
+        except Exception:
+            logger.exception(
+                f"Failed to resolve location_id ({location_id}) using ESI")
+            return location_id, None
+
+    missing = [location_id for location_id, category in pending.items()
+               if category in static_queries and location_id not in found]
+    if missing:
+        logger.info("Resolving %s location_ids using ESI" % len(missing))
+        for location_id, name in map_concurrently(resolve_using_esi, missing):
+            if name:
+                found[location_id] = name
+
+    if found:
+        cache.set_many({str(location_id): name for location_id, name in found.items()})
+    resolved.update(found)
+
+    for location_id, category in pending.items():
+        if category == 'asset_safety':
+            resolved[location_id] = "Asset Safety"
+        elif category == 'structure' and location_id not in resolved:
+            resolved[location_id] = "Unknown Structure"
+
+    return resolved
+
 def get_type_id_prerq_skill_ids(type_id):
     query = """SELECT 
         i.typeID         as itemID, 
@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.db import connections
+import threading
+import time
+
+
+def map_concurrently(func, items, max_workers=None):
+    """
+    Calls func for every item on a bounded thread pool and returns the results in item order.
+    Each call closes the database connections opened by its worker thread.
+    """
+    if max_workers is None:
+        max_workers = apps.get_app_config(
+            'django_eveonline_connector').ESI_BULK_WORKERS
+    items = list(items)
+    if not items:
+        return []
+
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda item: call_and_close(func, item), items))
+
+
+def call_and_close(func, *args, **kwargs):
+    """
+    Calls func, then closes every database connection of the calling worker thread (e.g default and eve_static).
+    """
+    try:
+        return func(*args, **kwargs)
+    finally:
+        connections.close_all()
+
+
+class RateLimiter():
+    """
+    Spaces out calls made from any number of threads to at most `rate` per second.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._next_call = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
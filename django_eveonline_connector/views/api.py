@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, reverse
-from django.db.models import Q
+from django.db.models import Q, Prefetch
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.http import HttpResponse, JsonResponse
@@ -140,6 +140,10 @@ class CharacterJson(BaseDatatableView):
         'corporation__alliance__name'
     ]
 
+    def get_initial_queryset(self):
+        return EveCharacter.objects.prefetch_related(
+            Prefetch('token', queryset=EveToken.objects.with_validity()))
+
     def filter_queryset(self, qs):
         search = self.request.GET.get('search[value]', None)
         if search: